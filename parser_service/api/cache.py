@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Optional
+
+import asyncpg
+
+from db.dals import CategoryDAL
+from db.session import async_session, engine
+from logger_config import parser_logger as logger
+from settings import (CATEGORIES_CHANNEL, CATEGORIES_LISTEN_CHECK,
+                      CATEGORIES_RECONNECT_DELAY,
+                      CATEGORIES_RECONNECT_MAX_DELAY)
+
+
+class CachedBody:
+    """Serialized response with its ETag"""
+
+    def __init__(self, data: Any) -> None:
+        self.body = json.dumps(data, ensure_ascii=False,
+                               separators=(',', ':')).encode()
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()[:20]
+
+
+def build_tree(rows: list[dict]) -> dict[Optional[int], dict]:
+    """Nested category tree with materialized paths and depths.
+
+    Every node is kept by id, the roots are the childs of the None node.
+    Childs keep the order of rows.
+    """
+    nodes = {row['id']: {**row, 'path': None, 'depth': None, 'childs': []}
+             for row in rows}
+    top = {'childs': []}
+    for node in nodes.values():
+        nodes.get(node['parent'], top)['childs'].append(node)
+    nodes[None] = top
+
+    stack = [(node, '', 0) for node in reversed(top['childs'])]
+    while stack:
+        node, parent_path, depth = stack.pop()
+        node['path'] = f"{parent_path}{node['id']}"
+        node['depth'] = depth
+        stack.extend((child, node['path'] + '.', depth + 1)
+                     for child in reversed(node['childs']))
+    return nodes
+
+
+class CategoryTreeCache:
+    """Category list and tree, built once per category load.
+
+    The bodies stay cached until load_all_categories commits a change,
+    which it announces with NOTIFY on CATEGORIES_CHANNEL. Without the
+    LISTEN connection nothing is cached: a lost connection drops the
+    bodies and is reconnected with backoff, a silently dead one is found
+    by a query every CATEGORIES_LISTEN_CHECK seconds.
+    """
+
+    def __init__(self) -> None:
+        self._bodies: dict[Any, CachedBody] = {}
+        self._nodes: Optional[dict[Optional[int], dict]] = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._connection: Optional[asyncpg.Connection] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        await self._disconnect()
+
+    async def _connect(self) -> None:
+        url = engine.url.set(drivername='postgresql')
+        connection = await asyncpg.connect(
+            url.render_as_string(hide_password=False))
+        await connection.add_listener(CATEGORIES_CHANNEL, self._notified)
+        connection.add_termination_listener(self._terminated)
+        # notifications missed while disconnected are not replayed
+        self.invalidate()
+        self._connection = connection
+        logger.info('category cache is listening on %s', CATEGORIES_CHANNEL)
+
+    async def _disconnect(self) -> None:
+        connection, self._connection = self._connection, None
+        self.invalidate()
+        if connection is not None and not connection.is_closed():
+            connection.remove_termination_listener(self._terminated)
+            await connection.close()
+
+    async def _listen(self) -> None:
+        """Keeps the LISTEN connection up while the app runs"""
+        delay = CATEGORIES_RECONNECT_DELAY
+        while True:
+            try:
+                await self._connect()
+                delay = CATEGORIES_RECONNECT_DELAY
+                while self._connection is not None:
+                    await asyncio.sleep(CATEGORIES_LISTEN_CHECK)
+                    if self._connection is not None:
+                        await self._connection.execute('SELECT 1')
+            except Exception as err:
+                logger.error('category cache is off, no LISTEN: %s', err)
+            await self._disconnect()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, CATEGORIES_RECONNECT_MAX_DELAY)
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._bodies = {}
+        self._nodes = None
+
+    def _notified(self, connection, pid, channel, payload) -> None:
+        logger.info('categories changed, dropping the cached tree')
+        self.invalidate()
+
+    def _terminated(self, connection) -> None:
+        logger.error('category cache LISTEN connection is lost')
+        self._connection = None
+        self.invalidate()
+
+    async def _tree(self) -> dict[Optional[int], dict]:
+        if self._nodes is not None:
+            return self._nodes
+        async with self._lock:
+            if self._nodes is None:
+                generation = self._generation
+                async with async_session() as session:
+                    rows = await CategoryDAL(session).get_all_rows()
+                nodes = build_tree(rows)
+                if self._connection is None or (
+                        generation != self._generation):
+                    return nodes
+                self._nodes = nodes
+        return self._nodes
+
+    def _body(self, key: Any, data: Any, generation: int) -> CachedBody:
+        cached = self._bodies.get(key)
+        if cached is None:
+            cached = CachedBody(data)
+            if self._nodes is not None and generation == self._generation:
+                self._bodies[key] = cached
+        return cached
+
+    async def categories(self) -> CachedBody:
+        """Flat list ordered by id"""
+        if 'list' in self._bodies:
+            return self._bodies['list']
+        generation = self._generation
+        nodes = await self._tree()
+        rows = [{key: value for key, value in node.items() if key != 'childs'}
+                for category_id, node in nodes.items()
+                if category_id is not None]
+        return self._body('list', rows, generation)
+
+    async def tree(self, category_id: Optional[int] = None
+                   ) -> Optional[CachedBody]:
+        """Nested tree, or the subtree of category_id, None if unknown"""
+        key = ('tree', category_id)
+        if key in self._bodies:
+            return self._bodies[key]
+        generation = self._generation
+        nodes = await self._tree()
+        if category_id not in nodes:
+            return None
+        node = nodes[category_id]
+        data = node['childs'] if category_id is None else node
+        return self._body(key, data, generation)
+
+
+category_tree = CategoryTreeCache()
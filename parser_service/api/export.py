@@ -0,0 +1,65 @@
+import csv
+import datetime
+import enum
+import io
+import json
+from typing import AsyncIterator, Iterable
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.sql import Select
+
+from db.dals import ArticleDAL
+from db.session import async_session
+from settings import STREAM_CHUNK
+
+
+class ExportFormat(str, enum.Enum):
+    json = "json"
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
+
+def _default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value)} is not serializable")
+
+
+def ndjson_chunk(rows: list[dict]) -> bytes:
+    return b"".join(
+        json.dumps(row, ensure_ascii=False, default=_default).encode()
+        + b"\n" for row in rows)
+
+
+def csv_chunk(rows: Iterable[Iterable]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def stream_query(query: Select, export: ExportFormat) -> StreamingResponse:
+    """Streams every row of query, STREAM_CHUNK rows in memory at a time"""
+    columns = [column.key for column in query.selected_columns]
+
+    async def body() -> AsyncIterator[bytes]:
+        if export == ExportFormat.csv:
+            yield csv_chunk([columns])
+        # the cursor lives as long as the transaction of this session
+        async with async_session() as session:
+            async with session.begin():
+                async for rows in ArticleDAL(session).stream(
+                        query, STREAM_CHUNK):
+                    if export == ExportFormat.csv:
+                        yield csv_chunk(
+                            [row[column] for column in columns]
+                            for row in rows)
+                    else:
+                        yield ndjson_chunk(rows)
+
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[export])
@@ -1,18 +1,171 @@
-from fastapi import APIRouter, Depends
+import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.dals import CategoryDAL
-from db.models import Category
+from api.cache import CachedBody, category_tree
+from api.export import ExportFormat, stream_query
+from db.dals import ArticleDAL, StatsDAL
 from db.session import get_db
+from settings import MAX_PAGE_SIZE, PAGE_SIZE
 
 parser_router = APIRouter()
 
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag in tags or "*" in tags
+
+
+def _cached_response(request: Request,
+                     cached: Optional[CachedBody]) -> Response:
+    if cached is None:
+        raise HTTPException(status_code=404, detail="category not found")
+    headers = {"ETag": cached.etag}
+    if _etag_matches(request, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(cached.body, media_type="application/json",
+                    headers=headers)
+
+
 @parser_router.get("/categories")
-async def get_categories_list(
+async def get_categories_list(request: Request) -> Response:
+    return _cached_response(request, await category_tree.categories())
+
+
+@parser_router.get("/categories/tree")
+async def get_categories_tree(request: Request) -> Response:
+    return _cached_response(request, await category_tree.tree())
+
+
+@parser_router.get("/categories/{category_id}/tree")
+async def get_category_subtree(request: Request,
+                               category_id: int) -> Response:
+    return _cached_response(request, await category_tree.tree(category_id))
+
+
+def _keyset_cursor(cursor: Optional[str], ids: int,
+                   timestamp: bool = False) -> Optional[tuple]:
+    """Parses "<id>,...[,<timestamp>]", the key of the last row of a page"""
+    if cursor is None:
+        return None
+    parts = cursor.split(",", ids)
+    try:
+        if len(parts) != ids + timestamp:
+            raise ValueError(cursor)
+        key = tuple(int(part) for part in parts[:ids])
+        if timestamp:
+            key += (datetime.datetime.fromisoformat(parts[ids]),)
+        return key
+    except ValueError:
+        raise HTTPException(status_code=422, detail="bad cursor")
+
+
+async def _page(db: AsyncSession, query, limit: int, next_cursor) -> dict:
+    async with db as session:
+        async with session.begin():
+            rows = await ArticleDAL(session).page(query, limit)
+    return {
+        "items": rows,
+        "next_cursor": next_cursor(rows[-1]) if len(rows) == limit else None,
+    }
+
+
+def _last_article(row: dict) -> str:
+    return f"{row['item']},{row['id']}"
+
+
+def _last_snapshot(row: dict) -> str:
+    return f"{row['article']},{row['timestamp'].isoformat()}"
+
+
+def _last_item_snapshot(row: dict) -> str:
+    return f"{row['item']},{_last_snapshot(row)}"
+
+
+@parser_router.get("/articles")
+async def get_articles(
+    category: Optional[int] = None,
+    brand: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    export: ExportFormat = Query(ExportFormat.json, alias="format"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Articles with their item, category and brand, ordered by item"""
+    query = ArticleDAL.articles_query(
+        category, brand, _keyset_cursor(cursor, 2))
+    if export != ExportFormat.json:
+        return stream_query(query, export)
+    return await _page(db, query, limit, _last_article)
+
+
+@parser_router.get("/articles/{article_id}/history")
+async def get_article_history(
+    article_id: int,
+    start: Optional[datetime.datetime] = Query(None, alias="from"),
+    end: Optional[datetime.datetime] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    export: ExportFormat = Query(ExportFormat.json, alias="format"),
+    db: AsyncSession = Depends(get_db)
+):
+    query = ArticleDAL.history_query(
+        article=article_id, start=start, end=end,
+        after=_keyset_cursor(cursor, 1, timestamp=True))
+    if export != ExportFormat.json:
+        return stream_query(query, export)
+    return await _page(db, query, limit, _last_snapshot)
+
+
+@parser_router.get("/history")
+async def get_history(
+    category: Optional[int] = None,
+    brand: Optional[int] = None,
+    start: Optional[datetime.datetime] = Query(None, alias="from"),
+    end: Optional[datetime.datetime] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    export: ExportFormat = Query(ExportFormat.json, alias="format"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Price history of many articles, ordered by item, article, timestamp"""
+    query = ArticleDAL.history_query(
+        category=category, brand=brand, start=start, end=end,
+        after=_keyset_cursor(cursor, 2, timestamp=True))
+    if export != ExportFormat.json:
+        return stream_query(query, export)
+    return await _page(db, query, limit, _last_item_snapshot)
+
+
+@parser_router.get("/stats/articles/{article_id}")
+async def get_article_stats(
+    article_id: int,
+    start: Optional[datetime.date] = Query(None, alias="from"),
+    end: Optional[datetime.date] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_db)
+) -> list[dict]:
+    """Daily min, max and average price with discount and stock"""
+    async with db as session:
+        async with session.begin():
+            return await StatsDAL(session).article_days(
+                article_id, start, end)
+
+
+@parser_router.get("/stats/categories/{category_id}")
+async def get_category_stats(
+    category_id: int,
+    brand: Optional[int] = None,
+    start: Optional[datetime.date] = Query(None, alias="from"),
+    end: Optional[datetime.date] = Query(None, alias="to"),
     db: AsyncSession = Depends(get_db)
-) -> list[Category]:
+) -> list[dict]:
+    """Daily prices and total stock of the articles of a category"""
     async with db as session:
         async with session.begin():
-            parser_dal = CategoryDAL(session)
-            return await parser_dal.get_all_items()
+            return await StatsDAL(session).category_days(
+                category_id, brand, start, end)
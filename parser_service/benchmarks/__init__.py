@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+service_path = Path(__file__).parents[1]
+
+for path in (str(service_path), str(service_path / 'loader')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
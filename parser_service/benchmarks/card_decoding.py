@@ -0,0 +1,156 @@
+"""Cards/s of the pydantic card path against the lean transform.
+
+The transform runs with CARD_VALIDATION = 'pydantic' (schema) and 'fast'.
+
+Decodes cards responses of MAX_ITEMS_IN_REQUEST cards and turns them into
+the cards BulkWriter takes both ways, then checks that they hold the same
+rows. Responses
+are generated by the stub catalogue, or read from a recorded cards
+response body:
+
+    python -m benchmarks.card_decoding --responses 50
+    python -m benchmarks.card_decoding --payload cards_response.json
+"""
+import argparse
+import datetime
+import json
+import time
+from typing import Callable
+
+import transform
+from benchmarks.wb_stub import Catalogue
+from constants import MAX_ITEMS_IN_REQUEST, MULTICOLOR_ID
+from schemas import ArticleSchema
+from records import CardRecord
+from transform import card_record, loads, orjson
+
+
+def legacy_rows(item: dict, chunk: int, category_id: int,
+                timestamp: datetime.datetime) -> dict:
+    """The pre-transform _collect_data body for one card"""
+    card_object = {'chunk': chunk, 'colors': {}, 'sizes': {}}
+    article_data = ArticleSchema(**item).dict()
+
+    card_object['brands'] = {
+        'id': item.get('brandId'),
+        'name': item.get('brand')
+    }
+    card_object['items'] = {
+        'id': item.get('root'),
+        'category': category_id,
+        'brand': item.get('brandId')
+    }
+    card_object['articles'] = {
+        'id': item.get('id'),
+        'item': item.get('root'),
+        'name': item.get('name')
+    }
+    card_object['articles_history'] = {
+        'article': item.get('id'),
+        'timestamp': timestamp,
+        'price_full': item.get('priceU'),
+        'price_with_discount': item.get('salePriceU'),
+        'sale': item.get('sale'),
+        'rating': item.get('rating'),
+        'feedbacks': item.get('feedbacks'),
+    }
+
+    colors = article_data.get('colors')
+    if colors:
+        card_object['articles'].update(
+            {'color': MULTICOLOR_ID} if len(colors) > 1 else
+            {'color': colors[0].get('id')})
+        for color in colors:
+            card_object['colors'].update(
+                {color.get('id'): color.get('name')})
+
+    sum_count = 0
+    for size in item.get('sizes'):
+        size_count = 0
+        for stock in size.get('stocks'):
+            item_count = stock.get('qty')
+            if item_count:
+                size_count += item_count
+        sum_count += size_count
+        card_object['sizes'].update({size.get('name'): size_count})
+
+    card_object['articles_history'].update({'sum_count': sum_count})
+    return card_object
+
+
+def card_object(record: CardRecord) -> dict:
+    """The nested dict layout of a card the writer took before CardRecord"""
+    card = {
+        'chunk': record.chunk,
+        'colors': dict(zip(record.color_ids, record.color_names)),
+        'sizes': dict(zip(record.size_names, record.size_counts)),
+        'brands': {'id': record.brand, 'name': record.brand_name},
+        'items': {'id': record.item, 'category': record.category,
+                  'brand': record.brand},
+        'articles': {'id': record.article, 'item': record.item,
+                     'name': record.name},
+        'articles_history': record.history_row(),
+    }
+    if record.color is not None:
+        card['articles']['color'] = record.color
+    return card
+
+
+def stub_responses(count: int, seed: int) -> list[bytes]:
+    catalogue = Catalogue(seed, 1, [count * MAX_ITEMS_IN_REQUEST])
+    products = list(catalogue.products.values())
+    return [
+        json.dumps({'data': {'products': [
+            product.card() for product in
+            products[idx:idx + MAX_ITEMS_IN_REQUEST]
+        ]}}).encode()
+        for idx in range(0, len(products), MAX_ITEMS_IN_REQUEST)
+    ]
+
+
+def run(bodies: list[bytes], decode: Callable[[bytes], dict],
+        transform: Callable) -> tuple[list, float]:
+    timestamp = datetime.datetime(2023, 1, 1)
+    started = time.perf_counter()
+    rows = [
+        transform(item, chunk, 0, timestamp)
+        for chunk, body in enumerate(bodies)
+        for item in decode(body).get('data').get('products')
+    ]
+    return rows, time.perf_counter() - started
+
+
+def main(args: argparse.Namespace) -> None:
+    if args.payload:
+        with open(args.payload, 'rb') as file:
+            bodies = [file.read()] * args.responses
+    else:
+        bodies = stub_responses(args.responses, args.seed)
+
+    results = {}
+    for name, validation, decode, make_rows in (
+        # aiohttp's response.json() decodes the body before json.loads
+        ('pydantic', None, lambda body: json.loads(body.decode()),
+         legacy_rows),
+        ('schema', 'pydantic', loads, card_record),
+        ('transform', 'fast', loads, card_record),
+    ):
+        if validation is not None:
+            transform.CARD_VALIDATION = validation
+        rows, elapsed = run(bodies, decode, make_rows)
+        results[name] = rows
+        print(f'{name:>10}: {len(rows)} cards in {elapsed:.3f}s -> '
+              f'{len(rows) / elapsed:.0f} cards/s')
+
+    print('decoder:', 'orjson' if orjson else 'json')
+    print('rows match:', results['pydantic'] == [
+        card_object(record) for record in results['transform']]
+        and results['schema'] == results['transform'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--responses', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--payload')
+    main(parser.parse_args())
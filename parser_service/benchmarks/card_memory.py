@@ -0,0 +1,59 @@
+"""Bytes per card of CardRecord against the nested dict layout.
+
+Turns cards responses from the stub catalogue into the cards the db queue
+holds, once as CardRecord and once as the nested dicts the writer took
+before, and reports the memory they keep alive (tracemalloc, after the
+responses are freed) and their pickled size, which is what the transform
+pool sends back:
+
+    python -m benchmarks.card_memory --responses 50
+"""
+import argparse
+import datetime
+import gc
+import pickle
+import tracemalloc
+from typing import Callable
+
+from benchmarks.card_decoding import card_object, stub_responses
+from transform import card_record, loads
+
+
+def measure(bodies: list[bytes],
+            transform: Callable) -> tuple[list, int, int]:
+    """Cards, bytes they hold and peak bytes while they were made"""
+    timestamp = datetime.datetime(2023, 1, 1)
+    gc.collect()
+    tracemalloc.start()
+    cards = [
+        transform(item, chunk, 0, timestamp)
+        for chunk, body in enumerate(bodies)
+        for item in loads(body).get('data').get('products')
+    ]
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cards, size, peak
+
+
+def main(args: argparse.Namespace) -> None:
+    bodies = stub_responses(args.responses, args.seed)
+
+    for name, transform in (
+        ('dicts', lambda *card: card_object(card_record(*card))),
+        ('records', card_record),
+    ):
+        cards, size, peak = measure(bodies, transform)
+        pickled = len(pickle.dumps(cards, pickle.HIGHEST_PROTOCOL))
+        print(f'{name:>8}: {len(cards)} cards, '
+              f'{size / len(cards):.0f} bytes/card held, '
+              f'{peak / len(cards):.0f} bytes/card peak, '
+              f'{pickled / len(cards):.0f} bytes/card pickled')
+        del cards
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--responses', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,98 @@
+"""End-to-end crawl throughput against the offline Wildberries stub.
+
+Starts benchmarks.wb_stub in a child process, points the loader at it and
+runs load_all_categories and load_all_items. Both write into the database
+from POSTGRES_URL, so use a scratch database:
+
+    python -m benchmarks.crawl --categories 20 --latency 0.05
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import socket
+import time
+
+from aiohttp import web
+
+from benchmarks.wb_stub import add_arguments, server_from_args, stub_env
+from logger_config import set_level
+
+
+def _serve(args: argparse.Namespace) -> None:
+    web.run_app(server_from_args(args).app(), host=args.host,
+                port=args.port, print=None)
+
+
+def _wait_for_port(host: str, port: int, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(args: argparse.Namespace) -> None:
+    os.environ.update(stub_env(args.host, args.port))
+    if args.log_level:
+        set_level(args.log_level)
+    # loader constants read the endpoints at import time
+    from categories import load_all_categories
+    from items import load_all_items
+
+    if not args.items_only:
+        started = time.monotonic()
+        diff = await load_all_categories()
+        elapsed = time.monotonic() - started
+        print(f'load_all_categories: {elapsed:.2f}s, '
+              f'{diff["new"]} new, {diff["changed"]} changed, '
+              f'{diff["deleted"] + diff["retired"]} removed, '
+              f'peak RSS {_peak_rss_mb():.0f} MB')
+
+    started = time.monotonic()
+    stats = await load_all_items(keyframe=args.keyframe)
+    elapsed = time.monotonic() - started
+    print(f'load_all_items: {elapsed:.2f}s\n'
+          f'  requests: {stats["requests"]} '
+          f'({stats["requests"] / elapsed:.0f} req/s)\n'
+          f'  cards:    {stats["cards"]} '
+          f'({stats["cards"] / elapsed:.0f} cards/s)\n'
+          f'  db rows:  {stats["rows"]} '
+          f'({stats["rows"] / elapsed:.0f} rows/s)\n'
+          f'  peak RSS: {_peak_rss_mb():.0f} MB')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--log-level')
+    parser.add_argument('--items-only', action='store_true',
+                        help='keep the categories of a previous run')
+    parser.add_argument('--keyframe', action='store_true',
+                        help='write every history snapshot')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = multiprocessing.Process(target=_serve, args=(args,), daemon=True)
+    server.start()
+    try:
+        _wait_for_port(args.host, args.port)
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
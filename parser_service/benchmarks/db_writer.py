@@ -0,0 +1,142 @@
+"""Rows/s of the per-card writer against the batched BulkWriter.
+
+Writes synthetic cards into the database from POSTGRES_URL, so point it
+at a scratch database with migrations applied:
+
+    python -m benchmarks.db_writer --cards 20000 --batch-size 1000
+"""
+import argparse
+import asyncio
+import datetime
+import random
+import time
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from db.models import (Article, ArticlesHistory, Brand, Category, Color,
+                       HistorySizeRelation, Item, Size)
+from db.session import async_session
+
+from dimensions import DimensionCache
+from records import CardRecord
+from writer import BulkWriter
+
+BENCH_CATEGORY_ID = 0
+BENCH_ARTICLE_OFFSET = 900_000_000
+SIZE_NAMES = ('XS', 'S', 'M', 'L', 'XL', 'XXL', '42', '44', '46', '48')
+
+
+def make_cards(count: int, offset: int, seed: int = 0) -> list[CardRecord]:
+    rnd = random.Random(seed)
+    timestamp = datetime.datetime.now()
+    cards = []
+    for idx in range(count):
+        article_id = BENCH_ARTICLE_OFFSET + offset + idx
+        brand_id = BENCH_ARTICLE_OFFSET + rnd.randrange(500)
+        color_id = BENCH_ARTICLE_OFFSET + rnd.randrange(50)
+        size_names = tuple(rnd.sample(SIZE_NAMES, rnd.randint(1, 8)))
+        size_counts = tuple(rnd.randrange(100) for _ in size_names)
+        cards.append(CardRecord(
+            chunk=0,
+            category=BENCH_CATEGORY_ID,
+            article=article_id,
+            item=article_id // 3,
+            brand=brand_id,
+            brand_name=f'brand {brand_id}',
+            name=f'article {article_id}',
+            color=color_id,
+            color_ids=(color_id,),
+            color_names=(f'color {color_id}',),
+            size_names=size_names,
+            size_counts=size_counts,
+            timestamp=timestamp,
+            price_full=rnd.randrange(10000, 1000000),
+            price_with_discount=rnd.randrange(10000, 1000000),
+            sale=rnd.randrange(90),
+            rating=rnd.randrange(6),
+            feedbacks=rnd.randrange(10000),
+            sum_count=sum(size_counts),
+        ))
+    return cards
+
+
+async def write_per_card(cards: list[CardRecord]) -> int:
+    """The pre-batching write path: one transaction per card"""
+    rows = 0
+    for card in cards:
+        async with async_session() as session:
+            async with session.begin():
+                for color_id, name in zip(card.color_ids, card.color_names):
+                    if await session.get(Color, color_id) is None:
+                        session.add(Color(id=color_id, name=name))
+                for entity, row in (
+                    (Brand, {'id': card.brand, 'name': card.brand_name}),
+                    (Item, {'id': card.item, 'category': card.category,
+                            'brand': card.brand}),
+                    (Article, {'id': card.article, 'item': card.item,
+                               'name': card.name, 'color': card.color}),
+                ):
+                    if await session.get(entity, row['id']) is None:
+                        session.add(entity(**row))
+                        await session.flush()
+
+                history = ArticlesHistory(**card.history_row())
+                session.add(history)
+
+                db_sizes = {}
+                for name, count in zip(card.size_names, card.size_counts):
+                    result = await session.scalars(
+                        select(Size).where(Size.name == name))
+                    size = result.first()
+                    if size is None:
+                        size = Size(name=name)
+                        session.add(size)
+                    db_sizes[name] = (count, size)
+                await session.flush()
+
+                for count, size in db_sizes.values():
+                    session.add(HistorySizeRelation(
+                        history=history.id, size=size.id, count=count))
+        rows += 4 + len(card.color_ids) + 2 * len(card.size_names)
+    return rows
+
+
+async def write_batched(cards: list[CardRecord], batch_size: int) -> int:
+    dimensions = DimensionCache()
+    await dimensions.warm()
+    writer = BulkWriter(dimensions)
+    for idx in range(0, len(cards), batch_size):
+        await writer.write(cards[idx:idx + batch_size])
+    return writer.rows
+
+
+async def main(cards_count: int, batch_size: int) -> None:
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                insert(Category).values(
+                    id=BENCH_CATEGORY_ID, name='benchmark', children=False
+                ).on_conflict_do_nothing())
+
+    offset = random.randrange(0, 50_000_000, cards_count)
+    for name, run in (
+        ('per card', lambda cards: write_per_card(cards)),
+        ('batched', lambda cards: write_batched(cards, batch_size)),
+    ):
+        cards = make_cards(cards_count, offset)
+        offset += cards_count
+        started = time.monotonic()
+        rows = await run(cards)
+        elapsed = time.monotonic() - started
+        print(f'{name:>10}: {cards_count} cards, {rows} rows '
+              f'in {elapsed:.2f}s -> {rows / elapsed:.0f} rows/s, '
+              f'{cards_count / elapsed:.0f} cards/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cards', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.cards, args.batch_size))
@@ -0,0 +1,32 @@
+"""Crawl throughput with the loader logging on and off.
+
+Runs benchmarks.crawl once per log level in a fresh process, the rest of
+the arguments are passed to it as they are. Both runs write keyframe
+history and the second one reuses the categories of the first, so they
+write the same snapshots:
+
+    python -m benchmarks.logging_overhead --categories 20 --latency 0.05
+"""
+import subprocess
+import sys
+
+LEVELS = (('on', 'DEBUG'), ('off', 'CRITICAL'))
+
+
+def main() -> None:
+    extra = ['--keyframe']
+    for name, level in LEVELS:
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.crawl', '--log-level', level,
+             *extra, *sys.argv[1:]],
+            stdout=subprocess.PIPE, text=True, check=True)
+        # the console handler shares stdout with the report
+        report = [line for line in result.stdout.splitlines()
+                  if line.startswith(('load_all', '  '))]
+        print(f'logging {name} ({level}):')
+        print('\n'.join(report))
+        extra.append('--items-only')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Write rate and table size of the size layouts of history snapshots.
+
+Writes synthetic cards with BulkWriter once with history_size_relation
+rows and once with the size arrays on articles_history, and reports the
+cards written per second and how much the history tables (with their
+indexes) grew. Point POSTGRES_URL at a scratch database with migrations
+applied:
+
+    python -m benchmarks.size_storage --cards 20000 --warehouse-stocks
+"""
+import argparse
+import asyncio
+import dataclasses
+import random
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from db.models import Category
+from db.session import async_session
+
+from benchmarks.db_writer import BENCH_CATEGORY_ID, make_cards
+from dimensions import DimensionCache
+from records import CardRecord
+from writer import BulkWriter
+
+HISTORY_TABLES = ('articles_history', 'history_size_relation')
+WAREHOUSES = (117986, 507, 686, 1733, 130744, 206348)
+
+
+def with_stocks(cards: list[CardRecord], seed: int = 0) -> list[CardRecord]:
+    """Cards with their size counts split between a few warehouses"""
+    rnd = random.Random(seed)
+    result = []
+    for card in cards:
+        stocks = []
+        for position, count in enumerate(card.size_counts):
+            warehouses = rnd.sample(WAREHOUSES, rnd.randint(1, 3))
+            for wh in warehouses[:-1]:
+                qty = rnd.randint(0, count)
+                stocks.append((position, wh, qty))
+                count -= qty
+            stocks.append((position, warehouses[-1], count))
+        result.append(dataclasses.replace(card, stocks=tuple(stocks)))
+    return result
+
+
+async def tables_size() -> int:
+    async with async_session() as session:
+        return await session.scalar(select(sum(
+            func.pg_total_relation_size(table) for table in HISTORY_TABLES)))
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                insert(Category).values(
+                    id=BENCH_CATEGORY_ID, name='benchmark', children=False
+                ).on_conflict_do_nothing())
+
+    dimensions = DimensionCache()
+    await dimensions.warm()
+    offset = random.randrange(0, 50_000_000, args.cards)
+    for size_storage in ('relation', 'array'):
+        cards = make_cards(args.cards, offset)
+        if args.warehouse_stocks:
+            cards = with_stocks(cards)
+        offset += args.cards
+
+        writer = BulkWriter(dimensions, size_storage=size_storage)
+        size = await tables_size()
+        started = time.monotonic()
+        for idx in range(0, len(cards), args.batch_size):
+            await writer.write(cards[idx:idx + args.batch_size])
+        elapsed = time.monotonic() - started
+        grown = await tables_size() - size
+        print(f'{size_storage:>9}: {args.cards} cards, {writer.rows} rows '
+              f'in {elapsed:.2f}s -> {args.cards / elapsed:.0f} cards/s, '
+              f'tables +{grown / 2 ** 20:.1f} MB, '
+              f'{grown / args.cards:.0f} bytes/card')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cards', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--warehouse-stocks', action='store_true')
+    asyncio.run(main(parser.parse_args()))
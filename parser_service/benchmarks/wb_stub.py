@@ -0,0 +1,274 @@
+"""Offline stand-in for the Wildberries endpoints the loader uses.
+
+Serves a synthetic catalogue generated from a seed:
+
+    /menu.json                     - main menu (MAIN_MENU)
+    /catalog/{shard}/v4/filters    - priceU and fbrand filters (BASE_URL)
+    /catalog/{shard}/catalog       - paginated products (BASE_URL)
+    /cards/detail                  - cards by ids (CARD_URL)
+
+Run it standalone and point the loader at it with
+
+    python -m benchmarks.wb_stub --port 8081
+    WB_MAIN_MENU=http://127.0.0.1:8081/menu.json \\
+    WB_BASE_URL=http://127.0.0.1:8081/catalog/ \\
+    WB_CARD_URL=http://127.0.0.1:8081/cards/detail python -m loader ...
+"""
+import argparse
+import asyncio
+import bisect
+import random
+from typing import Optional
+from urllib.parse import unquote
+
+from aiohttp import web
+
+PAGE_SIZE = 100
+MAX_PAGE = 100
+BRANDS_COUNT = 2000
+COLORS = ('белый', 'черный', 'красный', 'синий', 'зеленый', 'бежевый')
+SIZES = ('XS', 'S', 'M', 'L', 'XL', 'XXL')
+WAREHOUSES = (117986, 507, 686, 1733, 120762)
+CATEGORY_ID_OFFSET = 1000
+ARTICLE_ID_STEP = 1_000_000
+
+
+def stub_env(host: str, port: int) -> dict[str, str]:
+    """Environment overrides that point loader constants to the stub"""
+    base = f'http://{host}:{port}'
+    return {
+        'WB_MAIN_MENU': f'{base}/menu.json',
+        'WB_BASE_URL': f'{base}/catalog/',
+        'WB_CARD_URL': f'{base}/cards/detail',
+    }
+
+
+class Product:
+    __slots__ = ('id', 'root', 'brand', 'price', 'sale', 'colors', 'sizes',
+                 'rating', 'feedbacks')
+
+    def __init__(self, article_id: int, rnd: random.Random) -> None:
+        self.id = article_id
+        self.root = article_id - rnd.randrange(3)
+        self.brand = rnd.randrange(1, BRANDS_COUNT)
+        self.price = rnd.randrange(100, 50000) * 100
+        self.sale = rnd.randrange(0, 80)
+        self.colors = rnd.sample(range(len(COLORS)), rnd.choice((1, 1, 2)))
+        self.sizes = [
+            (size, [(wh, rnd.randrange(0, 50))
+                    for wh in rnd.sample(WAREHOUSES, rnd.randint(1, 3))])
+            for size in rnd.sample(SIZES, rnd.randint(1, len(SIZES)))
+        ]
+        self.rating = rnd.randrange(0, 6)
+        self.feedbacks = rnd.randrange(0, 5000)
+
+    def short(self) -> dict:
+        return {'id': self.id, 'priceU': self.price, 'brandId': self.brand}
+
+    def card(self) -> dict:
+        return {
+            'id': self.id,
+            'root': self.root,
+            'brandId': self.brand,
+            'brand': f'Brand {self.brand}',
+            'name': f'Product {self.id}',
+            'sale': self.sale,
+            'priceU': self.price,
+            'salePriceU': self.price * (100 - self.sale) // 100,
+            'rating': self.rating,
+            'feedbacks': self.feedbacks,
+            'colors': [{'id': idx + 1, 'name': COLORS[idx]}
+                       for idx in self.colors],
+            'sizes': [
+                {'name': name,
+                 'stocks': [{'wh': wh, 'qty': qty} for wh, qty in stocks]}
+                for name, stocks in self.sizes
+            ],
+        }
+
+
+class Catalogue:
+    def __init__(self, seed: int, categories: int,
+                 category_sizes: list[int]) -> None:
+        self.menu: list[dict] = []
+        self.shards: dict[str, list[Product]] = {}
+        self.prices: dict[str, list[int]] = {}
+        self.products: dict[int, Product] = {}
+
+        rnd = random.Random(seed)
+        children = []
+        for idx in range(categories):
+            category_id = CATEGORY_ID_OFFSET + idx + 1
+            shard = f'stub{idx}'
+            size = category_sizes[idx % len(category_sizes)]
+            products = sorted(
+                (Product(category_id * ARTICLE_ID_STEP + num, rnd)
+                 for num in range(size)),
+                key=lambda product: product.price)
+            self.shards[shard] = products
+            self.prices[shard] = [product.price for product in products]
+            self.products.update((product.id, product)
+                                 for product in products)
+            children.append({
+                'id': category_id,
+                'parent': CATEGORY_ID_OFFSET,
+                'name': f'Category {idx}',
+                'url': f'/catalog/stub/{idx}',
+                'shard': shard,
+                'query': f'subject={category_id}',
+            })
+        self.menu.append({
+            'id': CATEGORY_ID_OFFSET,
+            'name': 'Stub',
+            'url': '/catalog/stub',
+            'landing': True,
+            'childs': children,
+        })
+
+    def select(self, shard: str, params: dict) -> list[Product]:
+        products = self.shards.get(shard, [])
+        if 'priceU' in params:
+            low, high = (int(value) for value in params['priceU'].split(';'))
+            prices = self.prices[shard]
+            products = products[bisect.bisect_left(prices, low):
+                                bisect.bisect_right(prices, high)]
+        if 'fbrand' in params:
+            brands = {int(brand) for brand in params['fbrand'].split(';')}
+            products = [product for product in products
+                        if product.brand in brands]
+        return products
+
+
+def _params(request: web.Request) -> dict:
+    params = {}
+    for pair in request.query_string.split('&'):
+        key, _, value = pair.partition('=')
+        if key:
+            params[key] = unquote(value)
+    return params
+
+
+class StubServer:
+    def __init__(self, catalogue: Catalogue, latency: float,
+                 error_rate: float, seed: int) -> None:
+        self.catalogue = catalogue
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._rnd = random.Random(seed)
+
+    async def _delay(self) -> Optional[web.Response]:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self._rnd.expovariate(1 / self.latency))
+        if self._rnd.random() < self.error_rate:
+            return web.Response(status=self._rnd.choice((429, 500, 503)))
+        return None
+
+    async def menu(self, request: web.Request) -> web.Response:
+        error = await self._delay()
+        if error is not None:
+            return error
+        return web.json_response(self.catalogue.menu)
+
+    async def filters(self, request: web.Request) -> web.Response:
+        error = await self._delay()
+        if error is not None:
+            return error
+        params = _params(request)
+        products = self.catalogue.select(request.match_info['shard'], params)
+
+        if params.get('filters') == 'fbrand':
+            counts: dict[int, int] = {}
+            for product in products:
+                counts[product.brand] = counts.get(product.brand, 0) + 1
+            filters = [{'key': 'fbrand', 'items': [
+                {'id': brand, 'name': f'Brand {brand}', 'count': count}
+                for brand, count in sorted(counts.items())]}]
+        else:
+            filters = [{
+                'key': 'priceU',
+                'minPriceU': products[0].price if products else 0,
+                'maxPriceU': products[-1].price if products else 0,
+            }]
+        return web.json_response(
+            {'data': {'filters': filters, 'total': len(products)}})
+
+    async def catalog(self, request: web.Request) -> web.Response:
+        error = await self._delay()
+        if error is not None:
+            return error
+        params = _params(request)
+        products = self.catalogue.select(request.match_info['shard'], params)
+
+        sort = params.get('sort', 'popular')
+        if sort == 'pricedown':
+            products = products[::-1]
+        elif sort == 'popular':
+            products = sorted(products, key=lambda product: product.id)
+
+        page = int(params.get('page', 1))
+        if page > MAX_PAGE:
+            products = []
+        start = (page - 1) * PAGE_SIZE
+        return web.json_response({'data': {'products': [
+            product.short() for product in products[start:start + PAGE_SIZE]
+        ]}})
+
+    async def cards(self, request: web.Request) -> web.Response:
+        error = await self._delay()
+        if error is not None:
+            return error
+        ids = _params(request).get('nm', '')
+        products = self.catalogue.products
+        return web.json_response({'data': {'products': [
+            products[int(article_id)].card()
+            for article_id in ids.split(';')
+            if article_id and int(article_id) in products
+        ]}})
+
+    def app(self) -> web.Application:
+        # card requests carry up to 750 ids in the query string
+        app = web.Application(handler_args={'max_line_size': 65536})
+        app.add_routes([
+            web.get('/menu.json', self.menu),
+            web.get('/catalog/{shard}/v4/filters', self.filters),
+            web.get('/catalog/{shard}/catalog', self.catalog),
+            web.get('/cards/detail', self.cards),
+        ])
+        return app
+
+
+def make_server(seed: int = 0, categories: int = 10,
+                category_sizes: tuple[int, ...] = (500, 5000, 20000),
+                latency: float = 0.0, error_rate: float = 0.0) -> StubServer:
+    catalogue = Catalogue(seed, categories, list(category_sizes))
+    return StubServer(catalogue, latency, error_rate, seed)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--category-sizes', default='500,5000,20000',
+                        help='comma separated, cycled over categories')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='mean response delay in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of requests answered with 429/5xx')
+
+
+def server_from_args(args: argparse.Namespace) -> StubServer:
+    return make_server(
+        args.seed, args.categories,
+        tuple(int(size) for size in args.category_sizes.split(',')),
+        args.latency, args.error_rate)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    add_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(server_from_args(args).app(), host=args.host, port=args.port)
@@ -1,9 +1,13 @@
-from typing import List
+import datetime
+from typing import AsyncIterator, List, Optional
 
-from sqlalchemy import select
+from sqlalchemy import (Integer, Numeric, cast, func, select, true,
+                        tuple_)
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
-from db.models import Category
+from db.models import (Article, ArticleDailyPrice, ArticlesHistory,
+                       Category, CategoryDailyPrice, Item)
 
 
 class CategoryDAL:
@@ -16,3 +20,167 @@ class CategoryDAL:
             select(Category).order_by(Category.id)
         )
         return query.scalars().all()
+
+    async def get_all_rows(self) -> List[dict]:
+        """Category columns as plain dicts, without ORM objects"""
+        query = await self.db_session.execute(
+            select(Category.__table__).order_by(Category.id)
+        )
+        return [dict(row) for row in query.mappings()]
+
+
+class ArticleDAL:
+    """Keyset paginated reads of articles and their price history.
+
+    Articles are keyed by (item, id) and found through items_category_idx
+    or items_brand_idx and articles_item_idx, so a page continues inside
+    the indexes after the last key of the previous one and costs the same
+    at any depth. The history of many articles is read article by article
+    in that order, each through the (article, timestamp) unique index.
+    stream() reads the whole query through a server-side cursor.
+    """
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    @staticmethod
+    def _article_keys(category: Optional[int], brand: Optional[int],
+                      after: Optional[tuple[int, int]],
+                      inclusive: bool = False) -> Select:
+        query = select(Article.item, Article.id).join(
+            Item, Article.item == Item.id)
+        if category is not None:
+            query = query.where(Item.category == category)
+        if brand is not None:
+            query = query.where(Item.brand == brand)
+        if after is not None:
+            key = tuple_(Article.item, Article.id)
+            # the bound on Item.id starts the items index scan at the key
+            query = query.where(
+                Item.id >= after[0],
+                key >= tuple_(*after) if inclusive else key > tuple_(*after))
+        return query
+
+    @staticmethod
+    def articles_query(category: Optional[int] = None,
+                       brand: Optional[int] = None,
+                       after: Optional[tuple[int, int]] = None) -> Select:
+        query = ArticleDAL._article_keys(category, brand, after)
+        return query.add_columns(
+            Article.name, Article.color, Item.category, Item.brand,
+        ).order_by(Article.item, Article.id)
+
+    @staticmethod
+    def history_query(
+            article: Optional[int] = None,
+            category: Optional[int] = None,
+            brand: Optional[int] = None,
+            start: Optional[datetime.datetime] = None,
+            end: Optional[datetime.datetime] = None,
+            after: Optional[tuple] = None
+    ) -> Select:
+        """History keyed by (article, timestamp) of one article.
+
+        Without article the key is (item, article, timestamp): the
+        articles are paged by (item, id) and joined with their snapshots
+        LATERAL.
+        """
+        history = ArticlesHistory
+        snapshots = select(
+            history.article, history.timestamp,
+            history.price_full, history.price_with_discount,
+            history.sale, history.rating,
+            history.feedbacks, history.sum_count,
+        )
+        if start is not None:
+            snapshots = snapshots.where(history.timestamp >= start)
+        if end is not None:
+            snapshots = snapshots.where(history.timestamp < end)
+
+        if article is not None:
+            query = snapshots.where(history.article == article)
+            if after is not None:
+                query = query.where(
+                    tuple_(history.article, history.timestamp)
+                    > tuple_(*after))
+            return query.order_by(history.article, history.timestamp)
+
+        articles = ArticleDAL._article_keys(
+            category, brand, after and after[:2], inclusive=True).subquery()
+        snapshots = snapshots.where(
+            history.article == articles.c.id).lateral()
+        query = select(articles.c.item, *snapshots.c).select_from(
+            articles.join(snapshots, true()))
+        if after is not None:
+            query = query.where(
+                tuple_(articles.c.item, articles.c.id, snapshots.c.timestamp)
+                > tuple_(*after))
+        return query.order_by(articles.c.item, articles.c.id,
+                              snapshots.c.timestamp)
+
+    async def page(self, query: Select, limit: int) -> List[dict]:
+        result = await self.db_session.execute(query.limit(limit))
+        return [dict(row) for row in result.mappings()]
+
+    async def stream(self, query: Select,
+                     size: int) -> AsyncIterator[List[dict]]:
+        result = await self.db_session.stream(
+            query.execution_options(yield_per=size))
+        async for rows in result.mappings().partitions(size):
+            yield [dict(row) for row in rows]
+
+
+def _average(price_sum, prices):
+    # bigint / int would be an integer division, rounded down already
+    return cast(func.round(
+        cast(price_sum, Numeric) / func.nullif(prices, 0)), Integer)
+
+
+class StatsDAL:
+    """Daily price and stock stats, read from the rollup tables only"""
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    async def article_days(self, article: int,
+                           start: Optional[datetime.date] = None,
+                           end: Optional[datetime.date] = None) -> List[dict]:
+        daily = ArticleDailyPrice
+        query = select(
+            daily.day, daily.min_price, daily.max_price,
+            _average(daily.price_sum, daily.prices).label("avg_price"),
+            daily.last_price, daily.stock,
+        ).where(daily.article == article)
+        query = self._days(query, daily.day, start, end)
+        result = await self.db_session.execute(query)
+        return [dict(row) for row in result.mappings()]
+
+    async def category_days(self, category: int,
+                            brand: Optional[int] = None,
+                            start: Optional[datetime.date] = None,
+                            end: Optional[datetime.date] = None
+                            ) -> List[dict]:
+        daily = CategoryDailyPrice
+        query = (
+            select(daily.day,
+                   func.min(daily.min_price).label("min_price"),
+                   func.max(daily.max_price).label("max_price"),
+                   _average(func.sum(daily.price_sum),
+                            func.sum(daily.prices)).label("avg_price"),
+                   func.sum(daily.articles).label("articles"),
+                   func.sum(daily.stock).label("stock"))
+            .where(daily.category == category)
+            .group_by(daily.day)
+        )
+        if brand is not None:
+            query = query.where(daily.brand == brand)
+        query = self._days(query, daily.day, start, end)
+        result = await self.db_session.execute(query)
+        return [dict(row) for row in result.mappings()]
+
+    @staticmethod
+    def _days(query: Select, day, start: Optional[datetime.date],
+              end: Optional[datetime.date]) -> Select:
+        if start is not None:
+            query = query.where(day >= start)
+        if end is not None:
+            query = query.where(day <= end)
+        return query.order_by(day)
@@ -1,5 +1,6 @@
-from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Integer,
-                        String)
+from sqlalchemy import (BigInteger, Boolean, Column, Date, DateTime,
+                        ForeignKey, Index, Integer, String, UniqueConstraint)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -33,6 +34,11 @@ class Color(Base):
 
 class Item(Base):
     __tablename__ = "items"
+    __table_args__ = (
+        Index("items_category_idx", "category", "id"),
+        Index("items_brand_idx", "brand", "id"),
+        Index("items_category_brand_idx", "category", "brand", "id"),
+    )
 
     id = Column(Integer, primary_key=True)
     category = Column(Integer, ForeignKey("categories.id"))
@@ -43,7 +49,7 @@ class Size(Base):
     __tablename__ = "sizes"
 
     id = Column(Integer, primary_key=True)
-    name = Column(String)
+    name = Column(String, unique=True)
 
 
 class HistorySizeRelation(Base):
@@ -56,6 +62,7 @@ class HistorySizeRelation(Base):
 
 class Article(Base):
     __tablename__ = "articles"
+    __table_args__ = (Index("articles_item_idx", "item", "id"),)
 
     id = Column(Integer, primary_key=True)
     item = Column(Integer, ForeignKey("items.id"))
@@ -65,6 +72,10 @@ class Article(Base):
 
 class ArticlesHistory(Base):
     __tablename__ = "articles_history"
+    __table_args__ = (
+        UniqueConstraint("article", "timestamp"),
+        Index("articles_history_timestamp_idx", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True)
     article = Column(Integer, ForeignKey("articles.id"))
@@ -75,4 +86,70 @@ class ArticlesHistory(Base):
     rating = Column(Integer)
     feedbacks = Column(Integer)
     sum_count = Column(Integer)
+    # with SIZE_STORAGE = 'array' the sizes are kept here instead of
+    # history_size_relation, warehouse_stocks rows are (size, wh, qty)
+    size_ids = Column(ARRAY(Integer))
+    size_counts = Column(ARRAY(Integer))
+    warehouse_stocks = Column(ARRAY(Integer, dimensions=2))
     sizes = relationship("HistorySizeRelation")
+
+
+class CrawlRun(Base):
+    __tablename__ = "crawl_runs"
+
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, unique=True)
+    keyframe = Column(Boolean)
+    rolled_up = Column(Boolean, default=False)
+
+
+class CrawlTask(Base):
+    __tablename__ = "crawl_tasks"
+    __table_args__ = (
+        UniqueConstraint("run", "stage", "key"),
+        Index("crawl_tasks_claim_idx", "run", "stage", "status"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    run = Column(DateTime)
+    stage = Column(String)
+    key = Column(String)
+    payload = Column(JSONB)
+    status = Column(String)
+    owner = Column(String)
+    lease_until = Column(DateTime)
+    attempts = Column(Integer, default=0)
+
+
+class ArticleDailyPrice(Base):
+    """Prices with discount and stock of an article over a day of runs"""
+    __tablename__ = "article_daily_prices"
+    __table_args__ = (Index("article_daily_prices_day_idx", "day"),)
+
+    article = Column(Integer, ForeignKey("articles.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    min_price = Column(Integer)
+    max_price = Column(Integer)
+    price_sum = Column(BigInteger)
+    prices = Column(Integer)
+    last_price = Column(Integer)
+    stock = Column(Integer)
+    last_timestamp = Column(DateTime)
+
+
+class CategoryDailyPrice(Base):
+    """Article day rollups summed up per category and brand.
+
+    No foreign keys, the rollups outlive categories removed from the menu.
+    """
+    __tablename__ = "category_daily_prices"
+
+    category = Column(Integer, primary_key=True)
+    brand = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    min_price = Column(Integer)
+    max_price = Column(Integer)
+    price_sum = Column(BigInteger)
+    prices = Column(Integer)
+    articles = Column(Integer)
+    stock = Column(BigInteger)
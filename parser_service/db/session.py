@@ -3,12 +3,12 @@ from typing import Generator
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
-from settings import POSTGRES_URL
+from settings import DB_ECHO, POSTGRES_URL
 
 engine = create_async_engine(
     POSTGRES_URL,
     future=True,
-    echo=True,
+    echo=DB_ECHO,
     execution_options={"isolation_level": "READ COMMITTED"},
 )
 
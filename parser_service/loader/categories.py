@@ -2,58 +2,144 @@ import sys
 from http import HTTPStatus
 from typing import Optional
 
-import requests
-from sqlalchemy import delete
+from aiohttp import ClientSession, ClientTimeout
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.models import Category
-from db.session import get_db
+from db.models import Category, Item
+from db.session import async_session
 from logger_config import parser_logger as logger
+from settings import CATEGORIES_CHANNEL
 
-from constants import MAIN_MENU
+from constants import MAIN_MENU, REQUEST_TIMEOUT
 from exceptions import EmptyResponseError, ResponseStatusCodeError
 from schemas import CategorySchema
+from transform import loads
+from utils import chunk_rows
+
+CATEGORY_FIELDS = ('name', 'parent', 'url', 'shard', 'query', 'children')
 
 
 def _handle_response(response: list[dict]) -> list[dict]:
+    """Category rows of the menu tree, every parent before its children"""
     result: list[dict] = []
-    for item in response:
-        childs: Optional[list[dict]] = item.get('childs')
-        landing: Optional[list[dict]] = item.get('landing')
-        parent: Optional[list[dict]] = item.get('parent')
-        if landing or parent:
-            section = CategorySchema(**item)
-            result.append(section.dict())
-            if childs:
-                result.extend(_handle_response(childs))
+    stack = list(reversed(response))
+    while stack:
+        item = stack.pop()
+        if item.get('landing') or item.get('parent'):
+            result.append(CategorySchema(**item).dict())
+            stack.extend(reversed(item.get('childs') or []))
     return result
 
 
-async def load_all_categories() -> None:
-    db = get_db()
-    session: AsyncSession = await anext(db)
+async def _fetch_menu() -> list[dict]:
+    timeout = ClientTimeout(total=REQUEST_TIMEOUT)
+    async with ClientSession(timeout=timeout) as client_session:
+        async with client_session.get(MAIN_MENU) as response:
+            if response.status != HTTPStatus.OK:
+                raise ResponseStatusCodeError()
+            menu: list[dict] = loads(await response.read())
+
+    if not menu:
+        raise EmptyResponseError()
+    return menu
+
+
+def _diff(fetched: list[dict],
+          existing: dict[int, tuple]) -> tuple[list[dict], int, set[int]]:
+    """Rows to upsert, how many of them are new and the removed ids"""
+    upserts = []
+    new = 0
+    for row in fetched:
+        current = existing.get(row['id'])
+        if current is None:
+            new += 1
+        elif current == tuple(row[field] for field in CATEGORY_FIELDS):
+            continue
+        upserts.append(row)
+    removed = set(existing) - {row['id'] for row in fetched}
+    return upserts, new, removed
 
-    catalogue_url: str = MAIN_MENU
-    try:
-        response = requests.get(catalogue_url)
 
-        if response.status_code != HTTPStatus.OK:
-            raise ResponseStatusCodeError()
+async def _upsert(session: AsyncSession, rows: list[dict]) -> None:
+    # rows keep the menu order, so a parent is written before its children
+    for chunk in chunk_rows(rows):
+        statement = insert(Category).values(chunk)
+        await session.execute(statement.on_conflict_do_update(
+            index_elements=[Category.id],
+            set_={field: statement.excluded[field]
+                  for field in CATEGORY_FIELDS}))
 
-        response_json: list[dict] = response.json()
 
-        if not len(response_json):
-            raise EmptyResponseError()
+async def _remove(session: AsyncSession, removed: set[int],
+                  parents: dict[int, Optional[int]]) -> tuple[int, int]:
+    """Deletes removed categories, the ones still referred to are retired.
 
-        objects: list[dict] = _handle_response(response_json)
+    A removed category stays while items or a remaining category refer
+    to it. It keeps its row without a shard, so the items loader skips it.
+    """
+    if not removed:
+        return 0, 0
+    result = await session.scalars(
+        select(Item.category).distinct().where(Item.category.in_(removed)))
+    kept = set(result)
+    kept.update(parent for category_id, parent in parents.items()
+                if category_id not in removed and parent in removed)
+    # the ancestors of a kept category are kept as well
+    stack = list(kept)
+    while stack:
+        parent = parents.get(stack.pop())
+        if parent in removed and parent not in kept:
+            kept.add(parent)
+            stack.append(parent)
 
-        inst_lst = [Category(**dct) for dct in objects]
+    deleted = removed - kept
+    if deleted:
+        await session.execute(
+            delete(Category).where(Category.id.in_(deleted))
+            .execution_options(synchronize_session=False))
+    retired = await session.execute(
+        update(Category)
+        .where(Category.id.in_(kept), Category.shard.is_not(None))
+        .values(shard=None)
+        .execution_options(synchronize_session=False))
+    return len(deleted), retired.rowcount
 
+
+async def load_all_categories() -> dict:
+    try:
+        fetched = _handle_response(await _fetch_menu())
     except Exception as error:
         logger.exception(error)
         sys.exit()
 
-    async with session.begin():
-        await session.execute(delete(Category))
-        session.add_all(inst_lst)
-        await session.commit()
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.execute(select(
+                Category.id,
+                *(getattr(Category, field) for field in CATEGORY_FIELDS)))
+            existing = {row[0]: tuple(row[1:]) for row in result}
+
+            upserts, new, removed = _diff(fetched, existing)
+            await _upsert(session, upserts)
+            parents = {category_id: row[1]
+                       for category_id, row in existing.items()}
+            parents.update((row['id'], row['parent']) for row in fetched)
+            deleted, retired = await _remove(session, removed, parents)
+            if upserts or deleted or retired:
+                # delivered on commit, the api drops its cached tree
+                await session.execute(
+                    select(func.pg_notify(CATEGORIES_CHANNEL, '')))
+
+    stats = {
+        'categories': len(fetched),
+        'new': new,
+        'changed': len(upserts) - new,
+        'deleted': deleted,
+        'retired': retired,
+    }
+    logger.info('categories: %d in the menu, %d new, %d changed, '
+                '%d deleted, %d retired', stats['categories'], stats['new'],
+                stats['changed'], stats['deleted'], stats['retired'])
+    return stats
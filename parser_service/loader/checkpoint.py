@@ -0,0 +1,161 @@
+import asyncio
+import datetime
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+from logger_config import parser_logger as logger
+
+
+class Checkpoint:
+    """Progress of one items run, kept in a json file.
+
+    A category is done when all its buckets (price ranges and brand
+    groups) were planned, a bucket is done when its ids were split into
+    chunks, and a chunk stays pending until every card fetched for it was
+    written to the db. A resumed run keeps the timestamp, re-queues the
+    pending buckets and chunks and skips finished categories. A refresh
+    keeps the (category, item, article) of the last article it queued in
+    last_fed and goes on after it. With keep_finished the file of a
+    complete run stays, a --processes shard leaves it for the parent.
+    """
+
+    def __init__(self, path: str, timestamp: datetime.datetime,
+                 keep_finished: bool = False) -> None:
+        self.path = Path(path)
+        self.timestamp = timestamp
+        self.keep_finished = keep_finished
+        self.categories: set[int] = set()
+        self.buckets: set[str] = set()
+        self.pending: dict[str, tuple[int, Optional[int]]] = {}
+        self.chunks: dict[int, tuple[int, str]] = {}
+        self.last_fed: Optional[tuple[int, int, int]] = None
+        self._remaining: dict[int, int] = {}
+        self._next_key = 0
+
+    @classmethod
+    def load(cls, path: str,
+             keep_finished: bool = False) -> Optional['Checkpoint']:
+        try:
+            with open(path, encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return None
+
+        checkpoint = cls(
+            path, datetime.datetime.fromisoformat(data['timestamp']),
+            keep_finished)
+        checkpoint.categories = set(data['categories'])
+        checkpoint.buckets = set(data['buckets'])
+        checkpoint.pending = {url: tuple(bucket)
+                              for url, bucket in data['pending'].items()}
+        checkpoint.chunks = {int(key): tuple(chunk)
+                             for key, chunk in data['chunks'].items()}
+        if data.get('last_fed') is not None:
+            checkpoint.last_fed = tuple(data['last_fed'])
+        checkpoint._next_key = max(checkpoint.chunks, default=-1) + 1
+        logger.info('resuming run %s: %d categories, %d buckets done, '
+                    '%d buckets and %d chunks pending', checkpoint.timestamp,
+                    len(checkpoint.categories), len(checkpoint.buckets),
+                    len(checkpoint.pending), len(checkpoint.chunks))
+        return checkpoint
+
+    def save(self) -> None:
+        data = {
+            'timestamp': self.timestamp.isoformat(),
+            'categories': sorted(self.categories),
+            'buckets': sorted(self.buckets),
+            'pending': self.pending,
+            'chunks': self.chunks,
+            'last_fed': self.last_fed,
+        }
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self.path)
+
+    async def autosave(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.save()
+
+    def unfinished(self) -> int:
+        """Buckets and chunks that are not done yet"""
+        return len(self.pending) + len(self.chunks)
+
+    def finish(self, failed: int) -> None:
+        if failed or self.unfinished():
+            self.save()
+            logger.critical('run is not complete, continue it with --resume')
+        elif self.keep_finished:
+            self.save()
+        else:
+            self.path.unlink(missing_ok=True)
+
+    def add_chunk(self, category_id: int, ids: str) -> int:
+        key = self._next_key
+        self._next_key += 1
+        self.chunks[key] = (category_id, ids)
+        return key
+
+    def chunk_fetched(self, key: int, cards: int) -> bool:
+        """Counts cards to be written for the chunk, True if there are none"""
+        if cards:
+            self._remaining[key] = cards
+            return False
+        self.chunks.pop(key, None)
+        return True
+
+    def cards_written(self, keys: Iterable[int]) -> list[int]:
+        """Chunks whose last card is among the written ones"""
+        finished = []
+        for key in keys:
+            if key not in self._remaining:
+                continue
+            self._remaining[key] -= 1
+            if not self._remaining[key]:
+                del self._remaining[key]
+                self.chunks.pop(key, None)
+                finished.append(key)
+        return finished
+
+    def add_bucket(self, category_id: int, url: str,
+                   total: Optional[int]) -> bool:
+        """Registers a planned bucket, False if it is already known"""
+        if url in self.buckets or url in self.pending:
+            return False
+        self.pending[url] = (category_id, total)
+        return True
+
+    def bucket_done(self, url: str) -> None:
+        self.pending.pop(url, None)
+        self.buckets.add(url)
+
+    def category_done(self, category_id: int) -> None:
+        self.categories.add(category_id)
+
+
+def save_shards(path: str, timestamp: datetime.datetime,
+                shards: list[list[int]]) -> None:
+    """Pins the categories of every --processes shard of a run"""
+    tmp_path = Path(path).with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({'timestamp': timestamp.isoformat(), 'shards': shards},
+                  file)
+    os.replace(tmp_path, path)
+
+
+def load_shards(
+        path: str) -> Optional[tuple[datetime.datetime, list[list[int]]]]:
+    try:
+        with open(path, encoding='utf-8') as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return None
+    return datetime.datetime.fromisoformat(data['timestamp']), data['shards']
+
+
+def remove_files(paths: Iterable[str]) -> None:
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
@@ -1,14 +1,63 @@
-MAIN_MENU = ('https://static-basket-01.wb.ru/vol0/'
-             'data/main-menu-ru-ru-v2.json')
-BASE_URL = 'https://catalog.wb.ru/catalog/'
+import os
+
+MAIN_MENU = os.environ.get(
+    'WB_MAIN_MENU',
+    'https://static-basket-01.wb.ru/vol0/data/main-menu-ru-ru-v2.json')
+BASE_URL = os.environ.get('WB_BASE_URL', 'https://catalog.wb.ru/catalog/')
 QUERY_PARAMS = '&appType=1&dest=-1029256,-102269,-1304596,-1281263'
-CARD_URL = f'https://card.wb.ru/cards/detail?spp=30{QUERY_PARAMS}&nm='
-LAST_PAGE_TRESHOLD = 95
+CARD_HOST = os.environ.get('WB_CARD_URL', 'https://card.wb.ru/cards/detail')
+CARD_URL = f'{CARD_HOST}?spp=30{QUERY_PARAMS}&nm='
 MAX_PAGE = 100
+ITEMS_PER_PAGE = 100
+BUCKET_CAPACITY = MAX_PAGE * ITEMS_PER_PAGE
+BUCKET_FILL = 0.8
+PAGE_WINDOW = 20
 MAX_ITEMS_IN_REQUEST = 750
-MAX_ITEMS_IN_BRANDS_FILTER = 500
 MAX_BRANDS_IN_REQUEST = 20
 MIN_PRICE_RANGE = 20000
 ATTEMPTS_COUNTER = 10
-REQUEST_LIMIT = 200
-WORKER_COUNT = 100
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30
+CIRCUIT_FAILURES = 20
+CIRCUIT_RESET_TIMEOUT = 30
+REQUEST_LIMIT = 50
+REQUEST_LIMIT_MIN = 4
+REQUEST_LIMIT_MAX = 300
+REQUEST_TIMEOUT = 30
+LATENCY_TOLERANCE = 3
+LIMIT_BACKOFF = 0.7
+LIMIT_DECREASE_COOLDOWN = 1
+LIMITER_LOG_INTERVAL = 30
+METRICS_INTERVAL = 5
+WORKER_COUNT = REQUEST_LIMIT_MAX
+DB_BATCH_SIZE = 1000
+DB_FLUSH_INTERVAL = 5
+DB_WRITER_COUNT = 2
+DB_WRITE_ATTEMPTS = 5
+TRANSFORM_PREFETCH = 2
+BUCKETS_QUEUE_SIZE = 1000
+IDS_QUEUE_SIZE = WORKER_COUNT * 2
+CARDS_QUEUE_SIZE = 100
+DB_QUEUE_BATCHES = 2
+MEMORY_CHECK_INTERVAL = 1
+MAX_QUERY_PARAMS = 32767
+MULTICOLOR_ID = 999999
+CARD_VALIDATION = 'fast'
+HISTORY_DELTA = True
+HISTORY_KEYFRAME_DAYS = 7
+CHECKPOINT_PATH = 'items_checkpoint.json'
+SHARDS_PATH = 'items_shards.json'
+CHECKPOINT_INTERVAL = 30
+REFRESH_CHECKPOINT_PATH = 'refresh_checkpoint.json'
+REFRESH_FETCH_SIZE = 10000
+PROFILE_REPORT_PATH = 'items_profile.txt'
+PROFILE_TOP = 40
+ATTRIBUTION_POLICY = 'leaf_first'
+SIZE_STORAGE = 'relation'
+WAREHOUSE_STOCKS = False
+TASK_LEASE = 60
+TASK_MAX_ATTEMPTS = 5
+TASK_HEARTBEAT_INTERVAL = 10
+TASK_CLAIM_BATCH = 10
+TASK_POLL_INTERVAL = 1
+TASK_SEED_BATCH = 5000
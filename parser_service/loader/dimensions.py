@@ -0,0 +1,97 @@
+import asyncio
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from db.models import Brand, Color, Size
+from db.session import async_session
+from logger_config import parser_logger as logger
+
+from utils import chunk_rows
+
+
+class DimensionCache:
+    """In-process ids of brands, colors and sizes already stored in the db.
+
+    Misses are inserted in their own short transaction which is committed
+    before the ids get into the cache, so a cached id always points to a
+    committed row. The lock keeps writer tasks of one process from racing
+    on the same miss, the unique index on sizes.name covers other processes.
+    """
+
+    def __init__(self) -> None:
+        self.brands: set[int] = set()
+        self.colors: set[int] = set()
+        self.sizes: dict[str, int] = {}
+        self._lock = asyncio.Lock()
+
+    async def warm(self) -> None:
+        async with async_session() as session:
+            self.brands = set(await session.scalars(select(Brand.id)))
+            self.colors = set(await session.scalars(select(Color.id)))
+            result = await session.execute(select(Size.name, Size.id))
+            self.sizes = dict(result.all())
+
+        logger.info('dimension cache warmed: %d brands, %d colors, %d sizes',
+                    len(self.brands), len(self.colors), len(self.sizes))
+
+    async def ensure_brands(self, rows: Iterable[dict]) -> int:
+        return await self._ensure(Brand, self.brands, rows)
+
+    async def ensure_colors(self, rows: Iterable[dict]) -> int:
+        return await self._ensure(Color, self.colors, rows)
+
+    async def _ensure(self, entity, known: set[int],
+                      rows: Iterable[dict]) -> int:
+        missing = [row for row in rows if row['id'] not in known]
+        if not missing:
+            return 0
+
+        async with self._lock:
+            missing = sorted((row for row in missing
+                              if row['id'] not in known),
+                             key=lambda row: row['id'])
+            if not missing:
+                return 0
+            inserted = 0
+            async with async_session() as session:
+                async with session.begin():
+                    for chunk in chunk_rows(missing):
+                        result = await session.execute(
+                            insert(entity).values(chunk)
+                            .on_conflict_do_nothing())
+                        inserted += result.rowcount
+            known.update(row['id'] for row in missing)
+        return inserted
+
+    async def resolve_sizes(self, names: Iterable[str]) -> dict[str, int]:
+        """Returns ids for all the names, creating the missing sizes"""
+        names = set(names)
+        missing = names - self.sizes.keys()
+
+        if missing:
+            async with self._lock:
+                missing = sorted(missing - self.sizes.keys())
+                if missing:
+                    self.sizes.update(await self._create_sizes(missing))
+
+        return {name: self.sizes[name] for name in names}
+
+    async def _create_sizes(self, names: list[str]) -> dict[str, int]:
+        async with async_session() as session:
+            async with session.begin():
+                result = await session.execute(
+                    insert(Size).values([{'name': name} for name in names])
+                    .on_conflict_do_nothing(index_elements=[Size.name])
+                    .returning(Size.name, Size.id))
+                size_ids = dict(result.all())
+
+                # the rest was inserted by a concurrent writer
+                raced = [name for name in names if name not in size_ids]
+                if raced:
+                    result = await session.execute(
+                        select(Size.name, Size.id).where(
+                            Size.name.in_(raced)))
+                    size_ids.update(result.all())
+        return size_ids
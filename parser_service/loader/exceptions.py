@@ -11,3 +11,34 @@ class EmptyResponseError(BaseParserException):
 
 class ResponseStatusCodeError(BaseParserException):
     message = 'Unexpected response status code'
+
+
+class RequestAttemptsError(BaseParserException):
+    message = 'Request attempts exceeded'
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+
+    def __str__(self) -> str:
+        return f'{self.message} at: {self.url}'
+
+
+class AttributionPolicyError(BaseParserException):
+    message = 'Unknown ATTRIBUTION_POLICY'
+
+    def __init__(self, policy: str) -> None:
+        self.policy = policy
+
+    def __str__(self) -> str:
+        return f'{self.message} {self.policy!r}'
+
+
+class CardValidationError(BaseParserException):
+    message = 'Unexpected card field'
+
+    def __init__(self, article_id: int, field: str) -> None:
+        self.article_id = article_id
+        self.field = field
+
+    def __str__(self) -> str:
+        return f'{self.message} {self.field} at article {self.article_id}'
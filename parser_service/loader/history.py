@@ -0,0 +1,171 @@
+import datetime
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import ArticlesHistory, CrawlRun, HistorySizeRelation
+from db.session import async_session
+from logger_config import parser_logger as logger
+
+from constants import HISTORY_KEYFRAME_DAYS
+
+STATE_FIELDS = ('price_full', 'price_with_discount', 'sale', 'rating',
+                'feedbacks', 'sum_count')
+
+
+def fingerprint(history: dict, sizes: dict[int, int],
+                stocks: Iterable[Iterable[int]] = ()) -> int:
+    """Hash of everything a history snapshot stores for an article.
+
+    Only ints go into the hash, so it is stable between processes.
+    """
+    values = tuple(-1 if history[field] is None else history[field]
+                   for field in STATE_FIELDS)
+    return hash((values, tuple(sorted(sizes.items())),
+                 tuple(sorted(map(tuple, stocks)))))
+
+
+class Fingerprints:
+    """Article fingerprints in two parallel sorted int64 arrays.
+
+    16 bytes per article against about 100 in a dict, the loaded state
+    holds every article. Articles added during the run, which were not
+    in the loaded state, go to a dict.
+    """
+
+    def __init__(self) -> None:
+        self._articles = array('q')
+        self._values = array('q')
+        self._added: dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._articles) + len(self._added)
+
+    def append(self, article_id: int, value: int) -> None:
+        """Loads the state, in ascending article order"""
+        self._articles.append(article_id)
+        self._values.append(value)
+
+    def _index(self, article_id: int) -> Optional[int]:
+        idx = bisect_left(self._articles, article_id)
+        if idx < len(self._articles) and self._articles[idx] == article_id:
+            return idx
+        return None
+
+    def get(self, article_id: int) -> Optional[int]:
+        idx = self._index(article_id)
+        if idx is None:
+            return self._added.get(article_id)
+        return self._values[idx]
+
+    def update(self, fingerprints: dict[int, int]) -> None:
+        for article_id, value in fingerprints.items():
+            idx = self._index(article_id)
+            if idx is None:
+                self._added[article_id] = value
+            else:
+                self._values[idx] = value
+
+
+class HistoryState:
+    """Last known snapshot fingerprint for every article.
+
+    On a delta run only the snapshots whose fingerprint changed are
+    written, a keyframe run writes all of them, so the state at any
+    timestamp is the latest row not older than the previous keyframe.
+    """
+
+    def __init__(self, timestamp: datetime.datetime,
+                 keyframe: bool) -> None:
+        self.timestamp = timestamp
+        self.keyframe = keyframe
+        self.fingerprints = Fingerprints()
+        self.skipped = 0
+
+    @classmethod
+    async def register_run(cls, timestamp: datetime.datetime,
+                           force_keyframe: bool = False) -> bool:
+        """Adds the run to crawl_runs if it is new, True for a keyframe"""
+        async with async_session() as session:
+            async with session.begin():
+                # a resumed run keeps the kind it was started with
+                keyframe: Optional[bool] = await session.scalar(
+                    select(CrawlRun.keyframe).where(
+                        CrawlRun.timestamp == timestamp))
+                if keyframe is None:
+                    keyframe = force_keyframe or await cls._keyframe_due(
+                        session, timestamp)
+                    session.add(
+                        CrawlRun(timestamp=timestamp, keyframe=keyframe))
+        return keyframe
+
+    @classmethod
+    async def start_run(cls, timestamp: datetime.datetime,
+                        force_keyframe: bool = False) -> 'HistoryState':
+        keyframe = await cls.register_run(timestamp, force_keyframe)
+        state = cls(timestamp, keyframe)
+        if not keyframe:
+            await state.load()
+        logger.info('history run at %s, keyframe: %s, %d known articles',
+                    timestamp, keyframe, len(state.fingerprints))
+        return state
+
+    @staticmethod
+    async def _keyframe_due(session: AsyncSession,
+                            timestamp: datetime.datetime) -> bool:
+        last_keyframe: Optional[datetime.datetime] = await session.scalar(
+            select(func.max(CrawlRun.timestamp)).where(
+                CrawlRun.keyframe.is_(True)))
+        return last_keyframe is None or (
+            timestamp - last_keyframe
+            >= datetime.timedelta(days=HISTORY_KEYFRAME_DAYS))
+
+    async def load(self) -> None:
+        """Fingerprints of the latest snapshots in either size layout"""
+        latest = (
+            select(ArticlesHistory)
+            .distinct(ArticlesHistory.article)
+            .order_by(ArticlesHistory.article,
+                      ArticlesHistory.timestamp.desc())
+            .subquery()
+        )
+        relation = HistorySizeRelation
+        query = (
+            select(
+                latest.c.article,
+                *(latest.c[field] for field in STATE_FIELDS),
+                latest.c.warehouse_stocks,
+                func.coalesce(latest.c.size_ids, func.array_agg(
+                    aggregate_order_by(relation.size, relation.size)
+                ).filter(relation.size.isnot(None))).label('size_ids'),
+                func.coalesce(latest.c.size_counts, func.array_agg(
+                    aggregate_order_by(relation.count, relation.size)
+                ).filter(relation.size.isnot(None))).label('size_counts'),
+            )
+            .outerjoin(relation, relation.history == latest.c.id)
+            .group_by(*latest.c)
+            .order_by(latest.c.article)
+        )
+
+        async with async_session() as session:
+            result = await session.stream(query)
+            async for row in result:
+                history = row._mapping
+                sizes = dict(zip(history['size_ids'] or (),
+                                 history['size_counts'] or ()))
+                self.fingerprints.append(history['article'], fingerprint(
+                    history, sizes, history['warehouse_stocks'] or ()))
+
+    def changed(self, article_id: int, value: int) -> bool:
+        return self.keyframe or self.fingerprints.get(article_id) != value
+
+    def update(self, fingerprints: dict[int, int], skipped: int = 0) -> None:
+        """Takes the fingerprints and skip count of a written batch"""
+        self.skipped += skipped
+        # a keyframe writes every snapshot and never reads the state
+        if not self.keyframe:
+            self.fingerprints.update(fingerprints)
@@ -1,79 +1,203 @@
 import asyncio
-import sys
 import time
-from asyncio import Queue, Semaphore, Task, create_task
+from asyncio import Queue, Task, create_task
 import datetime
-
-import pydantic
-from aiohttp import ClientSession
-from constants import (ATTEMPTS_COUNTER, BASE_URL, CARD_URL,
-                       LAST_PAGE_TRESHOLD, MAX_BRANDS_IN_REQUEST,
-                       MAX_ITEMS_IN_BRANDS_FILTER, MAX_ITEMS_IN_REQUEST,
-                       MAX_PAGE, MIN_PRICE_RANGE, QUERY_PARAMS, REQUEST_LIMIT,
-                       WORKER_COUNT)
-from db.models import Category
-from db.session import get_db
+import hashlib
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from typing import AsyncIterator, Iterable, Optional, Union
+
+from aiohttp import ClientSession, ClientTimeout
+from constants import (ATTRIBUTION_POLICY, BASE_URL, BUCKET_CAPACITY,
+                       BUCKETS_QUEUE_SIZE, CARD_URL, CARDS_QUEUE_SIZE,
+                       CHECKPOINT_INTERVAL, CHECKPOINT_PATH, DB_BATCH_SIZE,
+                       DB_FLUSH_INTERVAL, DB_QUEUE_BATCHES, DB_WRITE_ATTEMPTS,
+                       DB_WRITER_COUNT,
+                       HISTORY_DELTA, IDS_QUEUE_SIZE, ITEMS_PER_PAGE,
+                       LIMITER_LOG_INTERVAL, MAX_ITEMS_IN_REQUEST, MAX_PAGE,
+                       METRICS_INTERVAL, MIN_PRICE_RANGE, PAGE_WINDOW,
+                       PROFILE_REPORT_PATH, QUERY_PARAMS,
+                       REFRESH_CHECKPOINT_PATH, REFRESH_FETCH_SIZE,
+                       REQUEST_LIMIT, REQUEST_LIMIT_MAX, REQUEST_TIMEOUT,
+                       SHARDS_PATH, TASK_SEED_BATCH, TRANSFORM_PREFETCH, WORKER_COUNT)
+from db.models import Article, Category, Item
+from db.session import async_session, get_db
+from checkpoint import Checkpoint, load_shards, remove_files, save_shards
+from dimensions import DimensionCache
+from exceptions import (AttributionPolicyError, CardValidationError,
+                        RequestAttemptsError)
+from history import HistoryState
+from limiter import ERROR, OK, THROTTLED, TIMEOUT, HostLimiters
 from logger_config import parser_logger as logger
-from schemas import ArticleSchema
-from sqlalchemy import select
+from logger_config import request_logger
+from memory import MemoryGuard, peak_rss_mb
+from metrics import (QUEUE_DEPTH, REQUEST_SECONDS, RETRIES, endpoint,
+                     serve_metrics)
+from partitioner import (CategoryProgress, balance_categories, group_brands,
+                         split_price_range)
+from profiling import profiler
+from records import CardRecord
+from retry import CircuitBreakers, DeadLetterQueue, RetryPolicy
+from rollups import roll_up_run
+from seen import SeenIds
+from transform import card_record, decode_cards, loads
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql.selectable import Select
-from db.models import (
-    Color,
-    Brand,
-    Item,
-    Article,
-    ArticlesHistory,
-    Size,
-    HistorySizeRelation
-)
+from work_queue import (LocalQueue, PgQueue, clear_run, failed_units,
+                        lock_runs, publish, retry_failed, unfinished_run)
+from writer import BulkWriter
 
 
 items_cnt = 0
-items_set = set()
 
-# TODO: Синхронные логи (асинк или сократить количество логирования)
 # TODO: Проверить алгоритмы фильтрации
-# TODO: Замеры в декораторе
 # TODO: Код стайл
 # TODO: Добавить БД
-# TODO: Найти/сократить синхронные вставки
 # TODO: После выполнения пунктов выше замеры, подбор параметров
 
 
 class ItemsParser:
 
-    def __init__(self, client_session: ClientSession) -> None:
+    def __init__(self, client_session: ClientSession, history: HistoryState,
+                 checkpoint: Checkpoint, batch_size: int = DB_BATCH_SIZE,
+                 flush_interval: float = DB_FLUSH_INTERVAL,
+                 transform_workers: int = 0,
+                 work_queues: Optional[dict[str, PgQueue]] = None,
+                 memory_limit: Optional[float] = None) -> None:
         self._session = client_session
-        self._timestamp = datetime.datetime.now()
-        self._request_semaphore = Semaphore(REQUEST_LIMIT)
-        self._categories_queue = Queue()
-        self._ids_queue = Queue()
-        self._cards_queue = Queue()
-        self._db_queue = Queue()
+        self._checkpoint = checkpoint
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._history = history
+        self._dimensions = DimensionCache()
+        self._writer = BulkWriter(self._dimensions, history)
+        self._timestamp = history.timestamp
+        self._limiters = HostLimiters()
+        self._breakers = CircuitBreakers()
+        self._retry_policy = RetryPolicy()
+        self._write_retry_policy = RetryPolicy(DB_WRITE_ATTEMPTS)
+        self._dead_letters = DeadLetterQueue()
+        self._progress: dict[int, CategoryProgress] = {}
+        self._seen = SeenIds()
+        self._saved_requests = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        if transform_workers:
+            # cards responses are decoded in child processes
+            self._pool = ProcessPoolExecutor(transform_workers)
+            self._transform_slots = asyncio.Semaphore(
+                transform_workers * TRANSFORM_PREFETCH)
+        # a distributed run shares the planning stages through crawl_tasks
+        self._work_queues = work_queues or {}
+        self._held: dict[int, int] = {}
+        self._categories_queue = self._work_queues.get(
+            'categories', LocalQueue())
+        # bounded stages make a fast producer wait for its consumers
+        self._buckets_queue = self._work_queues.get(
+            'buckets', LocalQueue(BUCKETS_QUEUE_SIZE))
+        self._ids_queue = self._work_queues.get(
+            'ids', LocalQueue(IDS_QUEUE_SIZE))
+        self._cards_queue = Queue(CARDS_QUEUE_SIZE)
+        self._db_queue = Queue(batch_size * DB_WRITER_COUNT * DB_QUEUE_BATCHES)
+        self._memory = MemoryGuard(memory_limit, self._downstream_drained)
         self._queues = (
             self._categories_queue,
+            self._buckets_queue,
             self._ids_queue,
             self._cards_queue,
             self._db_queue,
         )
         self._req_counter = 0
+        self._retries = 0
+
+    async def start(
+            self, categories: list[Category],
+            articles: Optional[AsyncIterator[tuple]] = None) -> None:
+        await self._dimensions.warm()
 
-    async def start(self, categories) -> None:
-        for category in categories.scalars():
-            category_as_dict = category.__dict__
-            shard = category_as_dict.get('shard')
-            if shard and 'blackhole' not in shard and 'preset' not in shard:
-                self._categories_queue.put_nowait(category_as_dict)
+        for category in _attribution_order(categories):
+            if category.id in self._checkpoint.categories:
+                continue
+            if _crawlable(category):
+                self._categories_queue.put_nowait(_category_unit(category))
 
         for _ in range(WORKER_COUNT):
             create_task(self._get_cards())
             create_task(self._collect_data())
             create_task(self._get_items_ids())
-        create_task(self._write_to_db())
+            create_task(self._traverse_buckets())
+        for _ in range(DB_WRITER_COUNT):
+            create_task(self._write_to_db())
+        reporter = create_task(self._limiters.report(LIMITER_LOG_INTERVAL))
+        depths = create_task(self._report_depths(METRICS_INTERVAL))
+        if self._work_queues:
+            background = [create_task(queue.heartbeat())
+                          for queue in self._work_queues.values()]
+        else:
+            background = [create_task(
+                self._checkpoint.autosave(CHECKPOINT_INTERVAL))]
+
+        # the queues are bounded, so workers take the resumed units as they
+        # are put
+        for url, (category_id, total) in list(
+                self._checkpoint.pending.items()):
+            await self._buckets_queue.put((category_id, url, total))
+        for key, (category_id, ids) in list(self._checkpoint.chunks.items()):
+            self._seen.filter_new(map(int, ids.split(';')))
+            await self._ids_queue.put((key, category_id, ids))
+        if articles is not None:
+            await self._feed(articles)
 
-        create_task(self._write_to_db())
         await create_task(self._waiter())
+        if self._dead_letters:
+            await self._dead_letters.replay()
+            await self._waiter()
+        self._dead_letters.report()
+        reporter.cancel()
+        depths.cancel()
+        for task in background:
+            task.cancel()
+        if not self._work_queues:
+            self._checkpoint.finish(len(self._dead_letters))
+        self._limiters.log_stats()
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def stats(self) -> dict:
+        return {
+            'requests': self._req_counter,
+            'retries': self._retries,
+            'dead_letters': self._dead_letters.replayed,
+            'unique_ids': len(self._seen),
+            'duplicate_ids': self._seen.duplicates,
+            'saved_card_requests': self._saved_requests,
+            'failed': len(self._dead_letters),
+            # the shared queues of a distributed run are drained by then
+            'unfinished': (0 if self._work_queues
+                           else self._checkpoint.unfinished()),
+            'cards': self._writer.cards,
+            'rows': self._writer.rows,
+            'batches': self._writer.batches,
+            'write_time': self._writer.write_time,
+            'skipped_history': self._history.skipped,
+            'memory_waits': self._memory.waits,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+    def _downstream_drained(self) -> bool:
+        return (self._ids_queue.qsize() == 0 and self._cards_queue.empty()
+                and self._db_queue.empty())
+
+    async def _report_depths(self, interval: float) -> None:
+        stages = ('categories', 'buckets', 'ids', 'cards', 'db')
+        while True:
+            for stage, queue in zip(stages, self._queues):
+                QUEUE_DEPTH.labels(stage).set(queue.qsize())
+            await asyncio.sleep(interval)
 
     async def _waiter(self) -> None:
         while True:
@@ -83,320 +207,524 @@ class ItemsParser:
             if all([queue.empty() for queue in self._queues]):
                 break
 
-    async def _get_data(self, url: str) -> dict:
-        async with self._request_semaphore:
-            attempts_counter = ATTEMPTS_COUNTER
-
-            while attempts_counter:
-                try:
-                    async with self._session.get(url, ssl=False) as response:
-                        if response.ok:
-                            self._req_counter += 1
-                            return await response.json(content_type=None)
-
-                        logger.info('Bad response status %d at: %s',
-                                    response.status, url)
+    @profiler.timed('get_data')
+    async def _get_data(self, url: str,
+                        raw: bool = False) -> Union[dict, bytes]:
+        limiter = self._limiters.get(url)
+        breaker = self._breakers.get(url)
+        kind = endpoint(url)
+
+        for attempt in range(self._retry_policy.attempts):
+            await breaker.wait()
+            await limiter.acquire()
+            started = time.monotonic()
+            outcome = ERROR
+            try:
+                async with self._session.get(url, ssl=False) as response:
+                    if response.ok:
+                        data = await response.read()
+                        if not raw:
+                            data = loads(data)
+                        outcome = OK
+                        self._req_counter += 1
+                        return data
+
+                    if (response.status == HTTPStatus.TOO_MANY_REQUESTS
+                            or response.status >= 500):
+                        outcome = THROTTLED
+                    request_logger.info('Bad response status %d at: %s',
+                                        response.status, url)
+
+            except asyncio.TimeoutError:
+                outcome = TIMEOUT
+                request_logger.info('request timeout at: %s', url)
+            except Exception as err:
+                request_logger.info('request error at: %s, %s', url, err)
+            finally:
+                latency = time.monotonic() - started
+                limiter.release(outcome, latency)
+                REQUEST_SECONDS.labels(kind, outcome).observe(latency)
+                if outcome == OK:
+                    breaker.success()
+                else:
+                    breaker.failure()
 
-                except Exception as err:
-                    logger.info('request error at: %s, %s', url, err)
+            self._retries += 1
+            RETRIES.labels(kind).inc()
+            request_logger.info('request at: %s, %d tries left',
+                                url, self._retry_policy.attempts - attempt - 1)
+            await asyncio.sleep(self._retry_policy.delay(attempt))
 
-                logger.info('request at: %s, %d tries left',
-                            url, attempts_counter)
-                attempts_counter -= 1
-                await asyncio.sleep(ATTEMPTS_COUNTER-attempts_counter)
-                if not attempts_counter:
-                    logger.critical('attempts_counter lost at: %s', url)
-                    sys.exit()
+        raise RequestAttemptsError(url)
 
     async def _get_items_ids(self) -> None:
         while True:
             category = await self._categories_queue.get()
+            try:
+                await self._parse_category(category)
+            except RequestAttemptsError as err:
+                self._dead_letters.add(
+                    'categories', err.url,
+                    partial(self._categories_queue.retry, category))
+            except Exception as err:
+                logger.exception('category %s failed: %s',
+                                 category.get('id'), err)
+            finally:
+                self._categories_queue.task_done()
+
+    async def _parse_category(self, category: dict) -> None:
+        category_id = category.get('id')
+        shard = category.get('shard')
+        query = category.get('query')
+        progress = self._progress.setdefault(
+            category_id, CategoryProgress(category_id))
+        progress.planned += 1
+
+        response = await self._fetch(category_id,
+                                     self._filters_url(shard, query))
+
+        response_data = response.get('data')
+        for ctg_filter in response_data.get('filters'):
+            if ctg_filter.get('key') == 'priceU':
+                ctg_max_price = ctg_filter.get('maxPriceU')
+                break
 
-            category_id = category.get('id')
-            shard = category.get('shard')
-            query = category.get('query')
-            price_filter_url = (f'{BASE_URL}{shard}/v4/'
-                                f'filters?{query}{QUERY_PARAMS}')
-
-            response = await self._get_data(price_filter_url)
-
-            ctg_filters = response.get('data').get('filters')
-            for ctg_filter in ctg_filters:
-                if ctg_filter.get('key') == 'priceU':
-                    ctg_max_price = ctg_filter.get('maxPriceU')
-                    break
+        await self._plan_price_range(category_id, shard, query, 0,
+                                     ctg_max_price, response_data.get('total'))
+        self._checkpoint.category_done(category_id)
+        progress.planning_done()
 
-            await self._basic_parsing(
-                category_id, shard, query, 0, ctg_max_price)
+        request_logger.info('parsed %s %s', shard, query)
 
-            self._categories_queue.task_done()
+    def _filters_url(self, shard: str, query: str,
+                     price_lmt: str = '') -> str:
+        return f'{BASE_URL}{shard}/v4/filters?{query}{QUERY_PARAMS}{price_lmt}'
 
-            logger.info('parsed %s %s', shard, query)
+    def _catalog_url(self, shard: str, query: str, price_lmt: str) -> str:
+        return f'{BASE_URL}{shard}/catalog?{QUERY_PARAMS}&{query}{price_lmt}'
 
-    async def _basic_parsing(self, category_id: int, shard: str, query: str,
-                             min_pr: int, max_pr: int) -> None:
-        logger.info('basic parsing for %s %s, price range: %s;%s',
-                    shard, query, min_pr, max_pr)
+    async def _fetch(self, category_id: int, url: str) -> dict:
+        response = await self._get_data(url)
+        self._progress[category_id].actual += 1
+        return response
 
+    async def _plan_price_range(self, category_id: int, shard: str,
+                                query: str, min_pr: int, max_pr: int,
+                                total: Optional[int]) -> None:
         price_lmt = f'&priceU={min_pr};{max_pr}'
-        base_url = (f'{BASE_URL}{shard}/catalog?'
-                    f'{QUERY_PARAMS}&{query}{price_lmt}')
-        last_page_url = base_url + '&page=' + str(MAX_PAGE)
-
-        response = await self._get_data(last_page_url)
-
-        response_data = response.get('data').get('products')
-        last_page_is_full = len(response_data) > LAST_PAGE_TRESHOLD
-
-        if last_page_is_full:
-            rnd_avg = round((max_pr + min_pr) // 2 + 100, -4)
-            if rnd_avg - min_pr >= MIN_PRICE_RANGE:
-                await self._basic_parsing(
-                    category_id, shard, query, min_pr, rnd_avg)
-                await self._basic_parsing(
-                    category_id, shard, query, rnd_avg, max_pr)
-            else:
-                await self._parse_by_brand(
-                    category_id, shard, query, price_lmt)
-        else:
-            await self._get_items_ids_chunk(category_id, base_url)
 
-    async def _parse_by_brand(self, category_id: int, shard: str, query: str,
-                              price_lmt: str) -> list[int]:
-        base_url = (f'{BASE_URL}{shard}/catalog?'
-                    f'{query}{QUERY_PARAMS}{price_lmt}')
-        brand_filter_url = (f'{BASE_URL}{shard}/v4/filters?filters='
-                            f'fbrand&{query}{QUERY_PARAMS}{price_lmt}')
-
-        response = await self._get_data(brand_filter_url)
+        if total is None or total <= BUCKET_CAPACITY:
+            await self._put_bucket(
+                category_id, self._catalog_url(shard, query, price_lmt),
+                total)
+            return
+
+        if max_pr - min_pr < MIN_PRICE_RANGE:
+            await self._plan_brands(category_id, shard, query, price_lmt)
+            return
+
+        ranges = split_price_range(min_pr, max_pr, total)
+        self._progress[category_id].planned += len(ranges)
+        logger.info('price range %s;%s of %s with %d items split into %d',
+                    min_pr, max_pr, category_id, total, len(ranges))
+
+        responses = await asyncio.gather(*(
+            self._fetch(category_id, self._filters_url(
+                shard, query, f'&priceU={low};{high}'))
+            for low, high in ranges
+        ))
+        await asyncio.gather(*(
+            self._plan_price_range(category_id, shard, query, low, high,
+                                   response.get('data').get('total'))
+            for (low, high), response in zip(ranges, responses)
+        ))
+
+    async def _plan_brands(self, category_id: int, shard: str, query: str,
+                           price_lmt: str) -> None:
+        base_url = self._catalog_url(shard, query, price_lmt)
+        brand_filter_url = self._filters_url(
+            shard, f'filters=fbrand&{query}', price_lmt)
+        self._progress[category_id].planned += 1
+
+        response = await self._fetch(category_id, brand_filter_url)
 
         brand_filters = response.get('data').get('filters')[0].get('items')
-        concatenated_ids_list = []
-        concatenated_ids = ''
-        cnt = 1
-
-        for brand in brand_filters:
-            brand_id = brand.get('id')
-            if brand.get('count') > MAX_ITEMS_IN_BRANDS_FILTER:
-                concatenated_ids_list.append(str(brand_id))
-            elif cnt < MAX_BRANDS_IN_REQUEST:
-                concatenated_ids += (';', '')[len(
-                    concatenated_ids) == 0] + str(brand_id)
-                cnt += 1
-            else:
-                concatenated_ids_list.append(concatenated_ids)
-                concatenated_ids = str(brand_id)
-                cnt = 1
-
-        if concatenated_ids:
-            concatenated_ids_list.append(concatenated_ids)
-
-        for idx, string in enumerate(concatenated_ids_list, 1):
-            request_url = base_url + '&fbrand=' + string
-            await self._get_items_ids_chunk(category_id, request_url)
-
-            logger.info(
-                'brand parsing for %s, %s: %d / %d requests done',
-                category_id, price_lmt, idx, len(concatenated_ids_list))
-
-    async def _traverse_pages(self, base_url: str, sorting: str) -> set:
-        traversed_ids = set()
+        groups = group_brands(brand_filters)
+        for brand_ids, total in groups:
+            await self._put_bucket(
+                category_id,
+                base_url + '&fbrand=' + ';'.join(map(str, brand_ids)), total)
+
+        logger.info('brand parsing for %s, %s: %d brands in %d groups',
+                    category_id, price_lmt, len(brand_filters), len(groups))
+
+    async def _put_bucket(self, category_id: int, base_url: str,
+                          total: Optional[int]) -> None:
+        if self._checkpoint.add_bucket(category_id, base_url, total):
+            self._progress[category_id].bucket_added(total)
+            await self._buckets_queue.put((category_id, base_url, total))
+
+    async def _traverse_buckets(self) -> None:
+        while True:
+            bucket = await self._buckets_queue.get()
+            category_id, base_url, total = bucket
+            progress = self._progress.setdefault(
+                category_id, CategoryProgress(category_id))
+            try:
+                await self._get_items_ids_chunk(category_id, base_url, total)
+                progress.bucket_done()
+            except RequestAttemptsError as err:
+                self._dead_letters.add(
+                    'buckets', err.url,
+                    partial(self._buckets_queue.retry, bucket))
+            except Exception as err:
+                logger.exception('bucket %s failed: %s', base_url, err)
+            finally:
+                self._buckets_queue.task_done()
+
+    def _page_window(self, target: Optional[int], collected: int) -> int:
+        """Pages to request at once, one by one while the total is unknown"""
+        if target is None:
+            return 1
+        missing = math.ceil((target - collected) / ITEMS_PER_PAGE)
+        return max(1, min(PAGE_WINDOW, missing))
+
+    @profiler.timed('traverse_pages')
+    async def _traverse_pages(self, category_id: int, base_url: str,
+                              sorting: str, traversed_ids: set,
+                              target: Optional[int]) -> bool:
+        """Adds ids of one sorting to traversed_ids, True if MAX_PAGE is hit.
+
+        Pages go in concurrent windows sized by the ids still missing up
+        to target. Every page of a window is used, the pass stops after a
+        window with an empty page or once target ids are collected. Full
+        pages may hold less than ITEMS_PER_PAGE products, so a short page
+        does not end it.
+        """
         base_url = base_url + sorting
         page = 1
         while page <= MAX_PAGE:
-            url = base_url + '&page=' + str(page)
-            response = await self._get_data(url)
-            response_data = response.get('data').get('products')
-
-            if not len(response_data):
-                return traversed_ids
-
-            for item in response_data:
-                traversed_ids.add(item.get('id'))
-            page += 1
-        if sorting == '&sort=popular':
-            traversed_ids.update(
-                await self._traverse_pages(base_url, '&sort=pricedown'))
-            traversed_ids.update(
-                await self._traverse_pages(base_url, '&sort=priceup'))
-        return traversed_ids
-
-    async def _get_items_ids_chunk(
-            self, category_id: int, base_url: str) -> None:
-        traversed_ids = await self._traverse_pages(base_url, '&sort=popular')
-
-        concatenated_ids = ''
-        cnt = 0
-        for item_id in traversed_ids:
-            if cnt < MAX_ITEMS_IN_REQUEST:
-                concatenated_ids += (';', '')[len(
-                    concatenated_ids) == 0] + str(item_id)
-                cnt += 1
-            else:
-                self._ids_queue.put_nowait((category_id, concatenated_ids))
-                concatenated_ids = str(item_id)
-                cnt = 1
-        self._ids_queue.put_nowait((category_id, concatenated_ids))
+            if target is not None and len(traversed_ids) >= target:
+                return False
+            await self._memory.wait()
+
+            window = self._page_window(target, len(traversed_ids))
+            pages = range(page, min(MAX_PAGE + 1, page + window))
+            responses = await asyncio.gather(*(
+                self._fetch(category_id, base_url + '&page=' + str(number))
+                for number in pages
+            ))
+            exhausted = False
+            for response in responses:
+                response_data = response.get('data').get('products')
+                traversed_ids.update(item.get('id') for item in response_data)
+                if not response_data:
+                    exhausted = True
+            if exhausted:
+                return False
+            page = pages.stop
+        return True
+
+    async def _get_items_ids_chunk(self, category_id: int, base_url: str,
+                                   total: Optional[int]) -> None:
+        traversed_ids = set()
+        capped = await self._traverse_pages(
+            category_id, base_url, '&sort=popular', traversed_ids, total)
+        # the catalog gives at most MAX_PAGE pages, the cheapest and the
+        # most expensive items are reached with the price sortings
+        for sorting in ('&sort=pricedown', '&sort=priceup'):
+            if not capped or (total is not None
+                              and len(traversed_ids) >= total):
+                break
+            await self._traverse_pages(
+                category_id, base_url, sorting, traversed_ids, total)
+        if total is not None and len(traversed_ids) < total:
+            request_logger.warning('bucket %s: got %d of %d ids',
+                                   base_url, len(traversed_ids), total)
+
+        # an article belongs to the first category that lists it
+        new_ids = self._seen.filter_new(traversed_ids)
+        self._saved_requests += (
+            math.ceil(len(traversed_ids) / MAX_ITEMS_IN_REQUEST)
+            - math.ceil(len(new_ids) / MAX_ITEMS_IN_REQUEST))
+
+        for idx in range(0, len(new_ids), MAX_ITEMS_IN_REQUEST):
+            await self._put_ids_chunk(category_id, ';'.join(
+                map(str, new_ids[idx:idx + MAX_ITEMS_IN_REQUEST])))
+        self._checkpoint.bucket_done(base_url)
+
+    async def _feed(self, articles: AsyncIterator[tuple]) -> None:
+        """Puts chunks of known article ids straight into the cards stage"""
+        async for category_id, ids, last in articles:
+            new_ids = self._seen.filter_new(ids)
+            if new_ids:
+                await self._put_ids_chunk(
+                    category_id, ';'.join(map(str, new_ids)))
+            # the chunk is in the checkpoint, a resume goes on after it
+            self._checkpoint.last_fed = last
+
+    async def _put_ids_chunk(self, category_id: int,
+                             concatenated_ids: str) -> None:
+        # a distributed unit is registered by the host that claims it
+        key = (None if self._work_queues
+               else self._checkpoint.add_chunk(category_id, concatenated_ids))
+        await self._ids_queue.put((key, category_id, concatenated_ids))
 
     async def _get_cards(self) -> None:
         while True:
-            category_id, concatenated_ids = await self._ids_queue.get()
+            key, category_id, concatenated_ids = await self._ids_queue.get()
+            if self._work_queues:
+                # the unit stays claimed until its cards are written
+                key = self._checkpoint.add_chunk(category_id, concatenated_ids)
+                self._held[key] = self._ids_queue.hold()
 
             url = CARD_URL + concatenated_ids
-            response = await self._get_data(url)
-            response_data = response.get('data').get('products')
-
-            self._cards_queue.put_nowait((category_id, response_data))
-            self._ids_queue.task_done()
+            try:
+                if self._pool is None:
+                    response = await self._get_data(url)
+                    cards = response.get('data').get('products')
+                    self._chunk_fetched(key, len(cards))
+                else:
+                    cards = await self._get_data(url, raw=True)
+                await self._cards_queue.put((key, category_id, cards))
+            except RequestAttemptsError as err:
+                self._chunk_failed(key, category_id, concatenated_ids, err.url)
+            except Exception as err:
+                logger.exception('cards request failed at %s: %s', url, err)
+                self._abandon_chunks([key])
+            finally:
+                self._ids_queue.task_done()
 
     async def _collect_data(self) -> None:
         while True:
-            category_id, cards = await self._cards_queue.get()
-
-            for item in cards:
-                card_object = {'colors': {}, 'sizes': {}}
-                try:
-                    article_data = ArticleSchema(**item).dict()
-                except pydantic.ValidationError:
-                    logger.critical('validation error at article %d',
-                                    item.get('id'))
-                    sys.exit()
-
-                card_object['brands'] = {
-                    'id': item.get('brandId'),
-                    'name': item.get('brand')
-                }
-
-                card_object['items'] = {
-                    'id': item.get('root'),
-                    'category': category_id,
-                    'brand': item.get('brandId')
-                }
-
-                card_object['articles'] = {
-                    'id': item.get('id'),
-                    'item': item.get('root'),
-                    'name': item.get('name')
-                }
-
-                card_object['articles_history'] = {
-                    'article': item.get('id'),
-                    'timestamp': self._timestamp,
-                    'price_full': item.get('priceU'),
-                    'price_with_discount': item.get('salePriceU'),
-                    'sale': item.get('sale'),
-                    'rating': item.get('rating'),
-                    'feedbacks': item.get('feedbacks'),
-                }
-
-                colors = article_data.get('colors')
-                if colors:
-                    card_object['articles'].update(
-                            {'color': 999999} if len(colors) > 1 else
-                            {'color': colors[0].get('id')})
-                    for color in colors:
-                        card_object['colors'].update(
-                            {color.get('id'): color.get('name')})
-
-                sum_count = 0
-                hash_sizes = {}
-                for size in item.get('sizes'):
-                    size_count = 0
-                    size_name = size.get('name')
-                    for stock in size.get('stocks'):
-                        item_count = stock.get('qty')
-                        if item_count:
-                            size_count += item_count
-                    hash_sizes[size_name] = size_count
-                    sum_count += size_count
-
-                    card_object['sizes'].update({size_name: size_count})
-
-                card_object['articles_history'].update(
-                    {'sum_count': sum_count})
-
-                self._db_queue.put_nowait(card_object)
-            self._cards_queue.task_done()
-
-            logger.info('collected data for %d: %s items',
-                        category_id, len(cards))
-
-    # TODO Make annotation for function (Сделать аннотацию функции)
-    async def _check_and_write(self, entity: any, data: dict, s) -> None:
-        item_in_db = await s.get(entity, data["id"])
-        if item_in_db is None:
-            s.add(entity(**data))
-
-    async def _write_to_db(self) -> None:
-        while True:
-            card = await self._db_queue.get()
-
-            global items_cnt
-            items_cnt += 1
-            global items_set
-            items_set.add(card['articles']['id'])
-
-            if items_cnt % 10000 == 0:
-                logger.critical('ITEMS COUNT <<< %d >>>', items_cnt)
-
-            db = get_db()
-            session: AsyncSession = await anext(db)
-
-            colors: list = card["colors"]
-            sizes: list = card["sizes"]
-            brands: dict = card["brands"]
-            items: dict = card["items"]
-            articles: dict = card["articles"]
-            articles_history: dict = card["articles_history"]
-
-            async with session.begin():
-                try:
-                    # TODO Убрать цикл после доработки от Саши
-                    for color in colors:
-                        await self._check_and_write(Color, color, session)
-
-                    await self._check_and_write(Brand, brands, session)
-                    await self._check_and_write(Item, items, session)
-                    await self._check_and_write(Article, articles, session)
-
-                    history_in_db = ArticlesHistory(**articles_history)
-                    session.add(history_in_db)
-
-                    # size in db
-                    # TODO Доработать запись в БД Size
-                    db_sizes = {}
-                    for size in sizes:
-                        res = await session.scalars(
-                            select(Size).where(Size.name == size["name"]))
-                        size_in_db = res.one_or_none()
-                        if size_in_db is None:
-                            size_in_db = Size(name=size["name"])
-                            session.add(size_in_db)
-                        db_sizes[size["name"]] = (size["count"], size_in_db)
-                    await session.flush()
-
-                    # history_size_relation in db
-                    for count, size_in_db in db_sizes.values():
-                        session.add(
-                            HistorySizeRelation(
-                                history=history_in_db.id,
-                                size=size_in_db.id,
-                                count=count
-                            )
-                        )
-
-                except Exception as err:
-                    await session.rollback()
-                    logger.critical("!!!!!!Error write_to_db!!!! %s", err)
-                    raise err
-                else:
-                    await session.commit()
-            self._db_queue.task_done()
+            key, category_id, cards = await self._cards_queue.get()
+            try:
+                await self._collect_chunk(key, category_id, cards)
+            except RequestAttemptsError as err:
+                self._chunk_failed(key, category_id,
+                                   self._checkpoint.chunks[key][1], err.url)
+            except Exception as err:
+                logger.exception('cards of %d were not collected: %s',
+                                 category_id, err)
+                self._abandon_chunks([key])
+            finally:
+                self._cards_queue.task_done()
+
+    @profiler.timed('collect_data')
+    async def _collect_chunk(self, key: int, category_id: int,
+                             cards: Union[list[dict], bytes]) -> None:
+        if self._pool is None:
+            records = self._transform(key, category_id, cards)
+        else:
+            records = await self._decode_in_pool(key, category_id, cards)
+        for record in records:
+            await self._db_queue.put(record)
+        request_logger.info('collected data for %d: %s items',
+                            category_id, len(records))
+
+    def _transform(self, key: int, category_id: int,
+                   cards: list[dict]) -> list[CardRecord]:
+        records = []
+        for item in cards:
+            try:
+                records.append(
+                    card_record(item, key, category_id, self._timestamp))
+            except CardValidationError as err:
+                logger.critical('%s', err)
+                self._cards_written([key])
+        return records
+
+    async def _decode_in_pool(self, key: int, category_id: int,
+                              body: bytes) -> list[CardRecord]:
+        """Decodes a cards body, fetched again while it does not decode.
+
+        A body that fails to decode is retried like a failed request and
+        ends with RequestAttemptsError, for the chunk to be dead-lettered.
+        """
+        url = CARD_URL + self._checkpoint.chunks[key][1]
+        attempts = self._retry_policy.attempts
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(self._retry_policy.delay(attempt - 1))
+                body = await self._get_data(url, raw=True)
+            try:
+                return await self._transform_in_pool(key, category_id, body)
+            except Exception as err:
+                self._retries += 1
+                RETRIES.labels('cards').inc()
+                request_logger.info('cards response at: %s did not decode, '
+                                    '%s, %d tries left', url, err,
+                                    attempts - attempt - 1)
+        raise RequestAttemptsError(url)
+
+    async def _transform_in_pool(self, key: int, category_id: int,
+                                 body: bytes) -> list[CardRecord]:
+        async with self._transform_slots:
+            records, errors = await asyncio.get_running_loop().run_in_executor(
+                self._pool, decode_cards, body, key, category_id,
+                self._timestamp)
+        for error in errors:
+            logger.critical('%s', error)
+        self._chunk_fetched(key, len(records))
+        return records
+
+    def _chunk_fetched(self, key: int, cards: int) -> None:
+        if self._checkpoint.chunk_fetched(key, cards):
+            self._release_chunks([key])
+
+    def _cards_written(self, keys: Iterable[int]) -> None:
+        self._release_chunks(self._checkpoint.cards_written(keys))
+
+    def _release_chunks(self, keys: list[int]) -> None:
+        for key in keys:
+            task_id = self._held.pop(key, None)
+            if task_id is not None:
+                self._ids_queue.release(task_id)
+
+    def _abandon_chunks(self, keys: Iterable[int]) -> None:
+        """Gives held units up, a host claims them once the lease runs out"""
+        for key in keys:
+            task_id = self._held.pop(key, None)
+            if task_id is not None:
+                self._ids_queue.abandon(task_id)
+
+    def _chunk_failed(self, key: int, category_id: int, ids: str,
+                      url: str) -> None:
+        """A chunk out of attempts, dead-lettered or given up if held"""
+        if self._work_queues:
+            self._abandon_chunks([key])
+        else:
+            self._dead_letters.add(
+                'cards', url,
+                partial(self._ids_queue.retry, (key, category_id, ids)))
 
+    async def _next_batch(self) -> list[CardRecord]:
+        batch = [await self._db_queue.get()]
+        deadline = time.monotonic() + self._flush_interval
 
-async def load_all_items() -> None:
-    start = time.time()
+        while len(batch) < self._batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(self._db_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
 
+    async def _write_to_db(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                written = await self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._db_queue.task_done()
+
+            if written:
+                global items_cnt
+                items_cnt += len(batch)
+                if items_cnt // 10000 != (items_cnt - len(batch)) // 10000:
+                    logger.critical('ITEMS COUNT <<< %d >>>', items_cnt)
+
+            logger.info('written batch of %d cards, %d cards total',
+                        len(batch), self._writer.cards)
+
+    @profiler.timed('write_to_db')
+    async def _write_batch(self, batch: list[CardRecord]) -> bool:
+        """Writes a batch, dead-lettered once it ran out of attempts.
+
+        A failed write rolls the whole transaction back, so a retry
+        writes the same batch again. The chunks of a dead-lettered batch
+        stay pending in the checkpoint. In a distributed run their units
+        are given up instead, the lease runs out and a host claims and
+        fetches them again.
+        """
+        attempts = self._write_retry_policy.attempts
+        for attempt in range(attempts):
+            try:
+                await self._writer.write(batch)
+            except Exception as err:
+                logger.error('error writing batch of %d cards, %d tries '
+                             'left: %s', len(batch), attempts - attempt - 1,
+                             err)
+                await asyncio.sleep(self._write_retry_policy.delay(attempt))
+                continue
+            self._cards_written(card.chunk for card in batch)
+            return True
+
+        if self._work_queues:
+            self._abandon_chunks({card.chunk for card in batch})
+        else:
+            self._dead_letters.add('db', f'batch of {len(batch)} cards',
+                                   partial(self._requeue_batch, batch))
+        return False
+
+    async def _requeue_batch(self, batch: list[CardRecord]) -> None:
+        for card in batch:
+            await self._db_queue.put(card)
+
+
+def _crawlable(category: Category) -> bool:
+    shard = category.shard
+    return bool(shard) and 'blackhole' not in shard and 'preset' not in shard
+
+
+def _attribution_order(categories: list[Category]) -> list[Category]:
+    """Categories in the order ATTRIBUTION_POLICY queues them.
+
+    An article listed by several categories is written with the category
+    whose bucket met it first. Buckets are traversed by many workers at
+    once, so the order makes that category likely, not certain: the
+    attribution of shared articles is best-effort and may differ between
+    runs. 'leaf_first' queues sub categories ahead of their parents,
+    'first_seen' keeps the table order.
+    """
+    categories = list(categories)
+    if ATTRIBUTION_POLICY == 'leaf_first':
+        categories.sort(key=lambda category: bool(category.children))
+    elif ATTRIBUTION_POLICY != 'first_seen':
+        raise AttributionPolicyError(ATTRIBUTION_POLICY)
+    return categories
+
+
+def _category_unit(category: Category) -> dict:
+    return {'id': category.id, 'shard': category.shard,
+            'query': category.query}
+
+
+def _shard_path(path: str, shard: Optional[int]) -> str:
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f'{root}.{shard}{ext}'
+
+
+def _checkpoint_path(shard: Optional[int]) -> str:
+    return _shard_path(CHECKPOINT_PATH, shard)
+
+
+def _write_profile(shard: Optional[int], stats: dict, **options) -> None:
+    """Stage timings of the run next to the settings they were taken with"""
+    profiler.stop()
+    settings = {
+        'REQUEST_LIMIT': REQUEST_LIMIT,
+        'REQUEST_LIMIT_MAX': REQUEST_LIMIT_MAX,
+        'WORKER_COUNT': WORKER_COUNT,
+        'PAGE_WINDOW': PAGE_WINDOW,
+        'MAX_ITEMS_IN_REQUEST': MAX_ITEMS_IN_REQUEST,
+        'DB_WRITER_COUNT': DB_WRITER_COUNT,
+        'TRANSFORM_PREFETCH': TRANSFORM_PREFETCH,
+        **options,
+    }
+    path = _shard_path(PROFILE_REPORT_PATH, shard)
+    profiler.write_report(path, settings, stats)
+    logger.critical('profile of the run written to %s', path)
+
+
+async def _load_categories(
+        category_ids: Optional[list[int]] = None) -> list[Category]:
     db = get_db()
     session: AsyncSession = await anext(db)
 
@@ -404,19 +732,301 @@ async def load_all_items() -> None:
         selectable = select(Category)
         # selectable: Select = select(Category).where(Category.id.in_([63010]))
         # selectable: Select = select(Category).where(Category.id.in_([130558]))
+        if category_ids is not None:
+            selectable = selectable.where(Category.id.in_(category_ids))
 
         categories = await session.execute(selectable)
-
-    async with ClientSession() as client_session:
-        parser = ItemsParser(client_session)
-
-        await parser.start(categories)
+    return categories.scalars().all()
+
+
+async def _known_articles(
+        category: Optional[int] = None, brand: Optional[int] = None,
+        after: Optional[tuple[int, int, int]] = None
+) -> AsyncIterator[tuple[int, list[int], tuple[int, int, int]]]:
+    """Ids of the articles in the db by category, a cards request each.
+
+    Read through a server-side cursor in the order of items_category_idx,
+    so the first chunks come before the whole table is read. Every chunk
+    comes with the (category, item, article) of its last id, after skips
+    the articles up to such a mark.
+    """
+    query = (
+        select(Item.category, Article.item, Article.id)
+        .join(Item, Article.item == Item.id)
+        .where(Item.category.is_not(None))
+        .order_by(Item.category, Article.item, Article.id)
+        .execution_options(yield_per=REFRESH_FETCH_SIZE)
+    )
+    if after is not None:
+        query = query.where(
+            tuple_(Item.category, Article.item, Article.id) > after)
+    if category is not None:
+        query = query.where(Item.category == category)
+    if brand is not None:
+        query = query.where(Item.brand == brand)
+
+    async with async_session() as session:
+        async with session.begin():
+            result = await session.stream(query)
+            chunk_category, ids, last = None, [], None
+            async for category_id, item_id, article_id in result:
+                if ids and (category_id != chunk_category
+                            or len(ids) == MAX_ITEMS_IN_REQUEST):
+                    yield chunk_category, ids, last
+                    ids = []
+                chunk_category = category_id
+                ids.append(article_id)
+                last = (category_id, item_id, article_id)
+            if ids:
+                yield chunk_category, ids, last
+
+
+async def _category_weights(categories: list[Category]) -> dict[int, int]:
+    """Items of every category by the db, the mean for unknown ones"""
+    async with async_session() as session:
+        result = await session.execute(
+            select(Item.category, func.count()).group_by(Item.category))
+    counts = dict(result.all())
+    known = [counts[category.id] for category in categories
+             if category.id in counts]
+    default = sum(known) // len(known) if known else 1
+    return {category.id: counts.get(category.id, default) or 1
+            for category in categories}
+
+
+async def _crawl(categories: list[Category], checkpoint: Checkpoint,
+                 keyframe: bool, batch_size: int, flush_interval: float,
+                 transform_workers: int,
+                 work_queues: Optional[dict[str, PgQueue]] = None,
+                 memory_limit: Optional[float] = None,
+                 articles: Optional[AsyncIterator] = None) -> dict:
+    history = await HistoryState.start_run(checkpoint.timestamp, keyframe)
+
+    timeout = ClientTimeout(total=REQUEST_TIMEOUT)
+    async with ClientSession(timeout=timeout) as client_session:
+        parser = ItemsParser(client_session, history, checkpoint, batch_size,
+                             flush_interval, transform_workers, work_queues,
+                             memory_limit)
+
+        await parser.start(categories, articles)
+
+    stats = parser.stats()
+    stats['items'] = items_cnt
+    return stats
+
+
+def _crawl_shard(shard: int, category_ids: list[int],
+                 timestamp: datetime.datetime, keyframe: bool, resume: bool,
+                 metrics_port: Optional[int], profile: Union[bool, str],
+                 **options) -> dict:
+    """Runs in a --processes child with its own loop, session and engine"""
+    if metrics_port:
+        serve_metrics(metrics_port + shard)
+    if profile:
+        profiler.start(cpu=profile == 'cpu')
+
+    async def crawl() -> dict:
+        categories = await _load_categories(category_ids)
+        path = _checkpoint_path(shard)
+        # a finished shard keeps its checkpoint till the whole run is done
+        checkpoint = (Checkpoint.load(path, keep_finished=True)
+                      if resume else None)
+        if checkpoint is None or checkpoint.timestamp != timestamp:
+            checkpoint = Checkpoint(path, timestamp, keep_finished=True)
+        return await _crawl(categories, checkpoint, keyframe, **options)
+
+    stats = asyncio.run(crawl())
+    if profile:
+        _write_profile(shard, stats, **options)
+    return stats
+
+
+async def _crawl_sharded(processes: int, keyframe: bool, resume: bool,
+                         metrics_port: Optional[int],
+                         profile: Union[bool, str], **options) -> dict:
+    """Splits categories between processes balanced by their item counts.
+
+    All processes write the same run timestamp, the parent registers the
+    run and sums up the stats. The split is kept in SHARDS_PATH and every
+    shard keeps its checkpoint until the whole run is done, so a resumed
+    run gives each shard the same categories and it skips what it had
+    finished.
+    """
+    plan = load_shards(SHARDS_PATH) if resume else None
+    if plan is not None:
+        timestamp, shards = plan
+        if len(shards) != processes:
+            logger.warning('resuming run %s in its %d processes',
+                           timestamp, len(shards))
+    else:
+        timestamp = datetime.datetime.now()
+        categories = [category for category in await _load_categories()
+                      if _crawlable(category)]
+        shards = balance_categories(await _category_weights(categories),
+                                    processes)
+        save_shards(SHARDS_PATH, timestamp, shards)
+    keyframe = await HistoryState.register_run(timestamp, keyframe)
+    logger.info('crawling %d categories in %d processes',
+                sum(map(len, shards)), len(shards))
+
+    loop = asyncio.get_running_loop()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(len(shards), mp_context=context) as pool:
+        results = await asyncio.gather(*(
+            loop.run_in_executor(pool, partial(
+                _crawl_shard, shard, category_ids, timestamp, keyframe,
+                resume, metrics_port, profile, **options))
+            for shard, category_ids in enumerate(shards)
+        ))
+    stats = {key: sum(stats[key] for stats in results) for key in results[0]}
+    # the counters add up, peak memory is that of the largest process
+    stats['peak_rss_mb'] = max(stats['peak_rss_mb'] for stats in results)
+    stats['timestamp'] = timestamp
+    if not stats['failed'] and not stats['unfinished']:
+        remove_files([SHARDS_PATH] + [_checkpoint_path(shard)
+                                      for shard in range(len(shards))])
+    return stats
+
+
+def _work_queues(run: datetime.datetime) -> dict[str, PgQueue]:
+    return {
+        'categories': PgQueue(run, 'categories', lambda unit: str(unit['id'])),
+        'buckets': PgQueue(run, 'buckets', lambda bucket: bucket[1]),
+        'ids': PgQueue(run, 'ids', lambda chunk: hashlib.md5(
+            chunk[2].encode()).hexdigest()),
+    }
+
+
+async def _join_distributed_run(categories: list[Category],
+                                keyframe: bool) -> datetime.datetime:
+    """Timestamp of the unfinished distributed run.
+
+    Without one a new run is registered and seeded with the categories,
+    under a lock so that hosts starting together end up in one run. The
+    units a run failed on are tried again by the hosts joining it.
+    """
+    async with async_session() as session:
+        async with session.begin():
+            await lock_runs(session)
+            timestamp = await unfinished_run(session)
+            if timestamp is not None:
+                retried = await retry_failed(session, timestamp)
+                logger.info('joining distributed run %s, %d failed units '
+                            'retried', timestamp, retried)
+                return timestamp
+
+            timestamp = datetime.datetime.now()
+            await HistoryState.register_run(timestamp, keyframe)
+            units = [(str(category.id), _category_unit(category))
+                     for category in _attribution_order(categories)
+                     if _crawlable(category)]
+            for idx in range(0, len(units), TASK_SEED_BATCH):
+                await publish(session, timestamp, 'categories',
+                              units[idx:idx + TASK_SEED_BATCH])
+            logger.info('started distributed run %s with %d categories',
+                        timestamp, len(units))
+    return timestamp
+
+
+async def _crawl_distributed(keyframe: bool, **options) -> dict:
+    """Works on the run shared by every host started with --distributed"""
+    timestamp = await _join_distributed_run(
+        await _load_categories(), keyframe)
+    stats = await _crawl([], Checkpoint(CHECKPOINT_PATH, timestamp),
+                         keyframe, work_queues=_work_queues(timestamp),
+                         **options)
+    # the run stays unfinished while it has failed units
+    stats['failed'] += await failed_units(timestamp)
+    await clear_run(timestamp)
+    stats['timestamp'] = timestamp
+    return stats
+
+
+async def _refresh(keyframe: bool, resume: bool, category: Optional[int],
+                   brand: Optional[int], **options) -> dict:
+    """Fetches the cards of the articles already in the db.
+
+    The catalogue is not traversed, the ids go from the articles table
+    straight to the cards stage. A resumed refresh re-queues the chunks
+    it had left and reads the ids after the last one it had queued.
+    """
+    checkpoint = Checkpoint.load(REFRESH_CHECKPOINT_PATH) if resume else None
+    if checkpoint is None:
+        checkpoint = Checkpoint(REFRESH_CHECKPOINT_PATH,
+                                datetime.datetime.now())
+    articles = _known_articles(category, brand, checkpoint.last_fed)
+    stats = await _crawl([], checkpoint, keyframe, articles=articles,
+                         **options)
+    stats['timestamp'] = checkpoint.timestamp
+    return stats
+
+
+async def load_all_items(batch_size: int = DB_BATCH_SIZE,
+                         flush_interval: float = DB_FLUSH_INTERVAL,
+                         keyframe: bool = not HISTORY_DELTA,
+                         resume: bool = False,
+                         transform_workers: int = 0,
+                         processes: int = 1,
+                         distributed: bool = False,
+                         metrics_port: Optional[int] = None,
+                         memory_limit: Optional[float] = None,
+                         refresh: bool = False,
+                         category: Optional[int] = None,
+                         brand: Optional[int] = None,
+                         profile: Union[bool, str] = False) -> dict:
+    start = time.time()
+    options = {'batch_size': batch_size, 'flush_interval': flush_interval,
+               'transform_workers': transform_workers,
+               'memory_limit': memory_limit}
+
+    if metrics_port and (distributed or processes <= 1):
+        serve_metrics(metrics_port)
+    # --processes children profile themselves, a report per process
+    sharded = processes > 1 and not (refresh or distributed)
+    if profile and not sharded:
+        profiler.start(cpu=profile == 'cpu')
+
+    if refresh:
+        if distributed or processes > 1:
+            logger.warning('--refresh runs in a single process')
+        stats = await _refresh(keyframe, resume, category, brand, **options)
+    elif distributed:
+        stats = await _crawl_distributed(keyframe, **options)
+    elif processes > 1:
+        # every process serves its metrics on a port of its own
+        stats = await _crawl_sharded(processes, keyframe, resume,
+                                     metrics_port, profile, **options)
+    else:
+        categories = await _load_categories()
+        checkpoint = Checkpoint.load(CHECKPOINT_PATH) if resume else None
+        if checkpoint is None:
+            checkpoint = Checkpoint(CHECKPOINT_PATH, datetime.datetime.now())
+        stats = await _crawl(categories, checkpoint, keyframe, **options)
+        stats['timestamp'] = checkpoint.timestamp
+
+    # a run with failed or unfinished units is finished by --resume,
+    # rolled up then
+    if not stats['failed'] and not stats['unfinished']:
+        await roll_up_run(stats['timestamp'])
 
     finish = time.time()
     impl_time = finish - start
+    stats['seconds'] = impl_time
     logger.critical('got %d items in %d seconds, %d requests, set length - %d',
-                    items_cnt, impl_time, parser._req_counter, len(items_set))
-
+                    stats['items'], impl_time, stats['requests'],
+                    stats['unique_ids'])
+    logger.critical('%d duplicate ids dropped, %d card requests saved',
+                    stats['duplicate_ids'], stats['saved_card_requests'])
+    logger.critical('written %d rows in %d batches, %.1f rows/s of db time',
+                    stats['rows'], stats['batches'],
+                    stats['rows'] / (stats['write_time'] or 1))
+    logger.critical('unchanged history snapshots skipped: %d',
+                    stats['skipped_history'])
+    logger.critical('peak rss %.0f MB, traversal held back %d times',
+                    stats['peak_rss_mb'], stats['memory_waits'])
+    if profile and not sharded:
+        _write_profile(None, stats, **options)
+    return stats
 
 # 130545 30930
 # 130558 129905
@@ -1,6 +1,8 @@
 import asyncio
+from functools import partial
 
 from logger_config import parser_logger as logger
+from logger_config import set_level
 
 from categories import load_all_categories
 from items import load_all_items
@@ -10,10 +12,34 @@ LAUNCH_OPTIONS = {
     "start": {
         "--categories": load_all_categories,
         "--items": load_all_items,
+        "--refresh": partial(load_all_items, refresh=True),
     },
 }
 
 
+def _convert(value: str) -> int | float | str:
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _parse_params(params: list[str]) -> dict:
+    """Turns ['--batch-size', '500', '--resume'] into keyword arguments"""
+    kwargs = {}
+    key = None
+    for param in params:
+        if param.startswith('--'):
+            key = param[2:].replace('-', '_')
+            kwargs[key] = True
+        elif key is not None:
+            kwargs[key] = _convert(param)
+            key = None
+    return kwargs
+
+
 def main(argv=None):
     if argv is None:
         logger.debug("argv is None")
@@ -22,9 +48,13 @@ def main(argv=None):
     func_name = argv[1:]
     try:
         logger.info(
-            f"start launcher with param: {func_name[0]} {func_name[1]}"
+            f"start launcher with param: {' '.join(func_name)}"
         )
-        asyncio.run(LAUNCH_OPTIONS[func_name[0]][func_name[1]]())
+        params = _parse_params(func_name[2:])
+        log_level = params.pop('log_level', None)
+        if log_level:
+            set_level(log_level)
+        asyncio.run(LAUNCH_OPTIONS[func_name[0]][func_name[1]](**params))
     except Exception as error:
         logger.exception(f"launcher failed: {error}")
 
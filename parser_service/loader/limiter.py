@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from logger_config import parser_logger as logger
+
+from constants import (LATENCY_TOLERANCE, LIMIT_BACKOFF,
+                       LIMIT_DECREASE_COOLDOWN, REQUEST_LIMIT,
+                       REQUEST_LIMIT_MAX, REQUEST_LIMIT_MIN)
+
+OK = 'ok'
+THROTTLED = 'throttled'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+
+class AdaptiveLimiter:
+    """AIMD limit of concurrent requests to one host.
+
+    Every fast successful response adds 1/limit to the limit, so it grows
+    by one per window of requests. Throttling (429/5xx), timeouts and
+    latency above LATENCY_TOLERANCE times the best seen latency multiply
+    it by LIMIT_BACKOFF, at most once per LIMIT_DECREASE_COOLDOWN seconds
+    so a burst of failures of one window counts as one signal.
+    """
+
+    def __init__(self, host: str, initial: int = REQUEST_LIMIT,
+                 min_limit: int = REQUEST_LIMIT_MIN,
+                 max_limit: int = REQUEST_LIMIT_MAX) -> None:
+        self.host = host
+        self.limit = float(initial)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._decreased_at = 0.0
+        self._base_latency = None
+        self.latency = 0.0
+        self.outcomes = {OK: 0, THROTTLED: 0, TIMEOUT: 0, ERROR: 0}
+
+    async def acquire(self) -> None:
+        while self._in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._wake_up()
+                raise
+        self._in_flight += 1
+
+    def release(self, outcome: str, latency: float) -> None:
+        self._in_flight -= 1
+        self.outcomes[outcome] += 1
+
+        if outcome == OK:
+            self.latency = latency if not self.latency else (
+                0.9 * self.latency + 0.1 * latency)
+            if self._base_latency is None or self.latency < self._base_latency:
+                self._base_latency = self.latency
+            if self.latency > self._base_latency * LATENCY_TOLERANCE:
+                self._decrease()
+            else:
+                self.limit = min(self._max_limit,
+                                 self.limit + 1 / self.limit)
+        elif outcome in (THROTTLED, TIMEOUT):
+            self._decrease()
+
+        self._wake_up()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._decreased_at < LIMIT_DECREASE_COOLDOWN:
+            return
+        self._decreased_at = now
+        self.limit = max(self._min_limit, self.limit * LIMIT_BACKOFF)
+        # let the best latency drift up so a slower host is the new normal
+        self._base_latency = (self._base_latency or 0) * 1.1
+
+    def _wake_up(self) -> None:
+        free = int(self.limit) - self._in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def stats(self) -> str:
+        return (f'{self.host}: limit {self.limit:.1f}, '
+                f'in flight {self._in_flight}, '
+                f'latency {self.latency * 1000:.0f} ms, '
+                + ', '.join(f'{key} {value}'
+                            for key, value in self.outcomes.items()))
+
+
+class HostLimiters:
+    """One AdaptiveLimiter per requested host"""
+
+    def __init__(self) -> None:
+        self._limiters: dict[str, AdaptiveLimiter] = {}
+
+    def get(self, url: str) -> AdaptiveLimiter:
+        host = urlsplit(url).netloc
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = self._limiters[host] = AdaptiveLimiter(host)
+        return limiter
+
+    def log_stats(self) -> None:
+        for limiter in self._limiters.values():
+            logger.info('limiter %s', limiter.stats())
+
+    async def report(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.log_stats()
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import resource
+import time
+from typing import Callable, Optional
+
+from logger_config import parser_logger as logger
+
+from constants import MEMORY_CHECK_INTERVAL
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def rss_mb() -> float:
+    """Resident memory of this process"""
+    with open('/proc/self/statm', encoding='ascii') as file:
+        return int(file.read().split()[1]) * PAGE_SIZE / 2 ** 20
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class MemoryGuard:
+    """Holds id traversal back while RSS is above limit_mb.
+
+    The stages behind traversal keep draining meanwhile, so the cards
+    waiting for the db are written before more ids are collected. The
+    allocator does not always give freed memory back, so traversal goes
+    on once drained() says there is nothing left to wait for.
+    """
+
+    def __init__(self, limit_mb: Optional[float] = None,
+                 drained: Callable[[], bool] = lambda: True) -> None:
+        self._limit = limit_mb
+        self._drained = drained
+        self._rss = 0.0
+        self._checked_at = 0.0
+        self.waits = 0
+
+    def _over_limit(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at >= MEMORY_CHECK_INTERVAL:
+            self._rss = rss_mb()
+            self._checked_at = now
+        return self._rss > self._limit
+
+    async def wait(self) -> None:
+        if not self._limit or not self._over_limit() or self._drained():
+            return
+        self.waits += 1
+        logger.warning('rss %.0f MB is over %.0f MB, holding traversal',
+                       self._rss, self._limit)
+        while self._over_limit() and not self._drained():
+            await asyncio.sleep(MEMORY_CHECK_INTERVAL)
@@ -0,0 +1,102 @@
+import math
+from typing import Optional
+
+from logger_config import parser_logger as logger
+
+from constants import (BUCKET_CAPACITY, BUCKET_FILL, ITEMS_PER_PAGE,
+                       MAX_BRANDS_IN_REQUEST, MAX_PAGE)
+
+PRICE_STEP = 100
+
+
+def split_price_range(min_price: int, max_price: int,
+                      total: int) -> list[tuple[int, int]]:
+    """Equal width sub-ranges, enough of them to fit total into buckets.
+
+    Buckets are filled up to BUCKET_FILL of their capacity, the rest is
+    headroom for uneven prices, an overfull sub-range is split again.
+    """
+    parts = max(2, math.ceil(total / (BUCKET_CAPACITY * BUCKET_FILL)))
+    step = math.ceil((max_price - min_price + 1) / parts / PRICE_STEP)
+    step = max(1, step) * PRICE_STEP
+
+    ranges = []
+    low = min_price
+    while low <= max_price:
+        high = min(max_price, low + step - 1)
+        ranges.append((low, high))
+        low = high + 1
+    return ranges
+
+
+def group_brands(brands: list[dict]) -> list[tuple[list[int], int]]:
+    """Packs brands into fbrand filters of at most BUCKET_CAPACITY items.
+
+    First fit decreasing: a brand that alone is larger than a bucket gets
+    a filter of its own and is traversed with all three sortings.
+    """
+    groups: list[tuple[list[int], int]] = []
+    for brand in sorted(brands, key=lambda brand: -brand.get('count', 0)):
+        count = brand.get('count', 0)
+        for idx, (ids, total) in enumerate(groups):
+            if (total + count <= BUCKET_CAPACITY
+                    and len(ids) < MAX_BRANDS_IN_REQUEST):
+                ids.append(brand.get('id'))
+                groups[idx] = (ids, total + count)
+                break
+        else:
+            groups.append(([brand.get('id')], count))
+    return groups
+
+
+def balance_categories(weights: dict[int, int],
+                       parts: int) -> list[list[int]]:
+    """Splits category ids into parts of about equal total weight.
+
+    Longest processing time first: the heaviest category goes to the
+    lightest part.
+    """
+    shards: list[list[int]] = [[] for _ in range(parts)]
+    loads = [0] * parts
+    for category_id in sorted(weights, key=lambda key: -weights[key]):
+        idx = loads.index(min(loads))
+        shards[idx].append(category_id)
+        loads[idx] += weights[category_id]
+    return shards
+
+
+def planned_pages(total: Optional[int]) -> int:
+    """Catalog requests _traverse_pages needs for a bucket of total items"""
+    if total is None:
+        return MAX_PAGE
+    if total > BUCKET_CAPACITY:
+        return 3 * MAX_PAGE
+    return min(MAX_PAGE, math.ceil(total / ITEMS_PER_PAGE))
+
+
+class CategoryProgress:
+    """Planned and made catalog requests of one category"""
+
+    def __init__(self, category_id: int) -> None:
+        self.category_id = category_id
+        self.planned = 0
+        self.actual = 0
+        self.pending_buckets = 0
+        self.planning = True
+
+    def bucket_added(self, total: Optional[int]) -> None:
+        self.pending_buckets += 1
+        self.planned += planned_pages(total)
+
+    def bucket_done(self) -> None:
+        self.pending_buckets -= 1
+        self._maybe_report()
+
+    def planning_done(self) -> None:
+        self.planning = False
+        self._maybe_report()
+
+    def _maybe_report(self) -> None:
+        if not self.planning and self.pending_buckets <= 0:
+            logger.info('category %s: planned %d requests, made %d',
+                        self.category_id, self.planned, self.actual)
@@ -0,0 +1,104 @@
+import cProfile
+import functools
+import io
+import math
+import pstats
+import time
+from collections import defaultdict
+from typing import Any, Callable, Optional
+
+from constants import PROFILE_TOP
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest rank percentile of sorted values"""
+    rank = max(0, math.ceil(percent / 100 * len(values)) - 1)
+    return values[rank]
+
+
+class StageProfiler:
+    """Durations of the loader stages, collected only while started.
+
+    A stage is a coroutine method wrapped with timed(), every call is one
+    sample. The time includes waiting on the limiter or a full queue of
+    the next stage, which is what the stage costs the pipeline. With cpu
+    the whole run goes through cProfile as well, its report is sorted by
+    own time, the cumulative time of a coroutine counts its suspensions.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._timings: dict[str, list[float]] = defaultdict(list)
+        self._cpu: Optional[cProfile.Profile] = None
+        self._started = 0.0
+
+    def start(self, cpu: bool = False) -> None:
+        self.enabled = True
+        self._timings.clear()
+        self._started = time.monotonic()
+        if cpu:
+            self._cpu = cProfile.Profile()
+            self._cpu.enable()
+
+    def stop(self) -> None:
+        self.enabled = False
+        if self._cpu is not None:
+            self._cpu.disable()
+
+    def timed(self, stage: str) -> Callable:
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs) -> Any:
+                if not self.enabled:
+                    return await func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self._timings[stage].append(
+                        time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """count, total and percentiles in seconds of every stage"""
+        result = {}
+        for stage, timings in self._timings.items():
+            timings = sorted(timings)
+            result[stage] = {'count': len(timings), 'total': sum(timings)}
+            for percent in PERCENTILES:
+                result[stage][f'p{percent}'] = percentile(timings, percent)
+            result[stage]['max'] = timings[-1]
+        return result
+
+    def report(self, settings: dict, stats: dict) -> str:
+        lines = [f'run of {time.monotonic() - self._started:.1f}s', '']
+        lines += [f'{key} = {value}' for key, value in settings.items()]
+        lines.append('')
+        lines += [f'{key}: {value}' for key, value in stats.items()]
+        lines += ['', f'{"stage":<16}{"count":>9}{"total s":>11}'
+                  + ''.join(f'{f"p{percent} ms":>11}'
+                            for percent in PERCENTILES)
+                  + f'{"max ms":>11}']
+        for stage, row in self.summary().items():
+            lines.append(
+                f'{stage:<16}{row["count"]:>9}{row["total"]:>11.2f}'
+                + ''.join(f'{row[f"p{percent}"] * 1000:>11.1f}'
+                          for percent in PERCENTILES)
+                + f'{row["max"] * 1000:>11.1f}')
+
+        if self._cpu is not None:
+            output = io.StringIO()
+            pstats.Stats(self._cpu, stream=output).sort_stats(
+                pstats.SortKey.TIME).print_stats(PROFILE_TOP)
+            lines += ['', output.getvalue()]
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, path: str, settings: dict, stats: dict) -> None:
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.report(settings, stats))
+
+
+profiler = StageProfiler()
@@ -0,0 +1,48 @@
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(slots=True)
+class CardRecord:
+    """One collected card on its way from the transform to the writer.
+
+    A flat slotted record takes a fraction of the memory of nested dicts
+    with their repeated keys and pickles smaller out of the transform
+    pool. Colors and sizes are kept as parallel tuples, stocks are
+    (size position, warehouse, qty) and only filled with WAREHOUSE_STOCKS.
+    The writer builds the insert rows of a batch from the records.
+    """
+
+    chunk: int
+    category: int
+    article: int
+    item: int
+    brand: int
+    brand_name: str
+    name: str
+    color: Optional[int]
+    color_ids: tuple[int, ...]
+    color_names: tuple[Optional[str], ...]
+    size_names: tuple[Optional[str], ...]
+    size_counts: tuple[int, ...]
+    timestamp: datetime.datetime
+    price_full: Optional[int]
+    price_with_discount: Optional[int]
+    sale: Optional[int]
+    rating: int
+    feedbacks: int
+    sum_count: int
+    stocks: tuple[tuple[int, int, int], ...] = ()
+
+    def history_row(self) -> dict:
+        return {
+            'article': self.article,
+            'timestamp': self.timestamp,
+            'price_full': self.price_full,
+            'price_with_discount': self.price_with_discount,
+            'sale': self.sale,
+            'rating': self.rating,
+            'feedbacks': self.feedbacks,
+            'sum_count': self.sum_count,
+        }
@@ -0,0 +1,112 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, NamedTuple
+from urllib.parse import urlsplit
+
+from logger_config import parser_logger as logger
+
+from constants import (ATTEMPTS_COUNTER, CIRCUIT_FAILURES,
+                       CIRCUIT_RESET_TIMEOUT, RETRY_BASE_DELAY,
+                       RETRY_MAX_DELAY)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, attempts: int = ATTEMPTS_COUNTER,
+                 base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY) -> None:
+        self.attempts = attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(
+            0, min(self._max_delay, self._base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Holds requests to a host back after a run of failures.
+
+    After CIRCUIT_FAILURES failures in a row the host is left alone for
+    CIRCUIT_RESET_TIMEOUT seconds, then requests go through again and
+    one more failure opens the circuit once more.
+    """
+
+    def __init__(self, host: str) -> None:
+        self.host = host
+        self._failures = 0
+        self._open_until = 0.0
+        self.opened = 0
+
+    async def wait(self) -> None:
+        delay = self._open_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def success(self) -> None:
+        self._failures = 0
+
+    def failure(self) -> None:
+        self._failures += 1
+        if self._failures >= CIRCUIT_FAILURES:
+            self._failures = CIRCUIT_FAILURES - 1
+            self._open_until = time.monotonic() + CIRCUIT_RESET_TIMEOUT
+            self.opened += 1
+            logger.warning('circuit opened for %s for %d seconds',
+                           self.host, CIRCUIT_RESET_TIMEOUT)
+
+
+class CircuitBreakers:
+    """One CircuitBreaker per requested host"""
+
+    def __init__(self) -> None:
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def get(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host)
+        return breaker
+
+
+class DeadLetter(NamedTuple):
+    stage: str
+    url: str
+    retry: Callable[[], Awaitable[None]]
+
+
+class DeadLetterQueue:
+    """Units of work whose requests ran out of attempts.
+
+    They are re-queued once at the end of the run, whatever fails again
+    is reported instead of aborting the whole crawl.
+    """
+
+    def __init__(self) -> None:
+        self._letters: list[DeadLetter] = []
+        self.replayed = 0
+
+    def __len__(self) -> int:
+        return len(self._letters)
+
+    def add(self, stage: str, url: str,
+            retry: Callable[[], Awaitable[None]]) -> None:
+        logger.warning('dead letter at %s: %s', stage, url)
+        self._letters.append(DeadLetter(stage, url, retry))
+
+    async def replay(self) -> None:
+        letters, self._letters = self._letters, []
+        logger.warning('replaying %d dead letters', len(letters))
+        for letter in letters:
+            await letter.retry()
+        self.replayed += len(letters)
+
+    def report(self) -> None:
+        for letter in self._letters:
+            logger.error('failed at %s: %s', letter.stage, letter.url)
+        if self._letters:
+            logger.critical('%d units failed after the replay',
+                            len(self._letters))
@@ -0,0 +1,138 @@
+import datetime
+from typing import Optional
+
+from sqlalchemy import Date, case, delete, func, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import (Article, ArticleDailyPrice, ArticlesHistory,
+                       CategoryDailyPrice, CrawlRun, Item)
+from db.session import async_session
+from logger_config import parser_logger as logger
+
+DAILY_COLUMNS = ('article', 'day', 'min_price', 'max_price', 'price_sum',
+                 'prices', 'last_price', 'stock', 'last_timestamp')
+CATEGORY_COLUMNS = ('category', 'brand', 'day', 'min_price', 'max_price',
+                    'price_sum', 'prices', 'articles', 'stock')
+
+
+def _price_columns(price, day: datetime.date) -> tuple:
+    """min, max, sum and count of a single price for DAILY_COLUMNS"""
+    return (literal(day, Date), price, price, func.coalesce(price, 0),
+            case((price.is_(None), 0), else_=1), price)
+
+
+async def _carry_over(session: AsyncSession, day: datetime.date,
+                      keyframe: Optional[datetime.datetime]) -> int:
+    """Starts the day of every tracked article from its previous day.
+
+    A delta run writes only the snapshots that changed, so an article
+    without a snapshot that day still has the price it ended the previous
+    one with. Articles not seen since the last keyframe are dropped.
+    """
+    daily = ArticleDailyPrice
+    started = await session.scalar(
+        select(daily.day).where(daily.day == day).limit(1))
+    if started is not None:
+        return 0
+
+    previous = select(func.max(daily.day)).where(
+        daily.day < day).scalar_subquery()
+    carried = select(
+        daily.article, *_price_columns(daily.last_price, day),
+        daily.stock, daily.last_timestamp,
+    ).where(daily.day == previous)
+    if keyframe is not None:
+        carried = carried.where(daily.last_timestamp >= keyframe)
+    result = await session.execute(
+        insert(daily).from_select(DAILY_COLUMNS, carried))
+    return result.rowcount
+
+
+async def _fold_snapshots(session: AsyncSession,
+                          timestamp: datetime.datetime,
+                          day: datetime.date) -> int:
+    """Adds the snapshots of a run to the day of their articles.
+
+    A resumed run can be folded after a later run of the same day, its
+    prices still count, but the last price and stock stay the later ones.
+    """
+    daily = ArticleDailyPrice
+    history = ArticlesHistory
+    snapshots = select(
+        history.article, *_price_columns(history.price_with_discount, day),
+        history.sum_count, history.timestamp,
+    ).where(history.timestamp == timestamp)
+
+    statement = insert(daily).from_select(DAILY_COLUMNS, snapshots)
+    excluded = statement.excluded
+    newer = or_(daily.last_timestamp.is_(None),
+                excluded.last_timestamp >= daily.last_timestamp)
+    result = await session.execute(statement.on_conflict_do_update(
+        index_elements=[daily.article, daily.day],
+        set_={
+            'min_price': func.least(daily.min_price, excluded.min_price),
+            'max_price': func.greatest(daily.max_price, excluded.max_price),
+            'price_sum': daily.price_sum + excluded.price_sum,
+            'prices': daily.prices + excluded.prices,
+            'last_price': case((newer, excluded.last_price),
+                               else_=daily.last_price),
+            'stock': case((newer, excluded.stock), else_=daily.stock),
+            'last_timestamp': func.greatest(daily.last_timestamp,
+                                            excluded.last_timestamp),
+        }))
+    return result.rowcount
+
+
+async def _sum_categories(session: AsyncSession, day: datetime.date) -> int:
+    """Rebuilds the category rollups of the day from the article ones"""
+    daily = ArticleDailyPrice
+    await session.execute(
+        delete(CategoryDailyPrice).where(CategoryDailyPrice.day == day))
+    totals = (
+        select(Item.category, Item.brand, literal(day, Date),
+               func.min(daily.min_price), func.max(daily.max_price),
+               func.sum(daily.price_sum), func.sum(daily.prices),
+               func.count(), func.sum(daily.stock))
+        .select_from(daily)
+        .join(Article, Article.id == daily.article)
+        .join(Item, Item.id == Article.item)
+        .where(daily.day == day, Item.category.is_not(None),
+               Item.brand.is_not(None))
+        .group_by(Item.category, Item.brand)
+    )
+    result = await session.execute(
+        insert(CategoryDailyPrice).from_select(CATEGORY_COLUMNS, totals))
+    return result.rowcount
+
+
+async def roll_up_run(timestamp: datetime.datetime) -> bool:
+    """Folds the snapshots of a finished run into the day rollups.
+
+    Only the snapshots of this run are read. Every run is folded once,
+    the host that marks it rolled_up does it and the others skip it.
+    """
+    day = timestamp.date()
+    async with async_session() as session:
+        async with session.begin():
+            claimed = await session.scalar(
+                update(CrawlRun)
+                .where(CrawlRun.timestamp == timestamp,
+                       CrawlRun.rolled_up.is_not(True))
+                .values(rolled_up=True)
+                .returning(CrawlRun.id))
+            if claimed is None:
+                return False
+
+            keyframe = await session.scalar(
+                select(func.max(CrawlRun.timestamp)).where(
+                    CrawlRun.keyframe.is_(True),
+                    CrawlRun.timestamp <= timestamp))
+            carried = await _carry_over(session, day, keyframe)
+            folded = await _fold_snapshots(session, timestamp, day)
+            categories = await _sum_categories(session, day)
+
+    logger.info('rolled up run %s: %d articles carried over, %d snapshots '
+                'folded, %d category rows for %s', timestamp, carried,
+                folded, categories, day)
+    return True
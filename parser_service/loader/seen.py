@@ -0,0 +1,42 @@
+from typing import Iterable
+
+GROWTH = 1.25
+
+
+class SeenIds:
+    """Article ids met during the run, one bit per possible id.
+
+    Wildberries ids are dense positive ints below a few hundred million,
+    so a bitmap of a few dozen megabytes holds all of them, where a set of
+    ints would take tens of bytes per id.
+    """
+
+    def __init__(self) -> None:
+        self._bits = bytearray()
+        self.count = 0
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+    def add(self, article_id: int) -> bool:
+        """Marks the id as seen, False if it had been seen before"""
+        byte, bit = divmod(article_id, 8)
+        if byte >= len(self._bits):
+            size = max(byte + 1, int(len(self._bits) * GROWTH))
+            self._bits.extend(bytes(size - len(self._bits)))
+
+        mask = 1 << bit
+        if self._bits[byte] & mask:
+            self.duplicates += 1
+            return False
+        self._bits[byte] |= mask
+        self.count += 1
+        return True
+
+    def filter_new(self, ids: Iterable[int]) -> list[int]:
+        return [article_id for article_id in ids if self.add(article_id)]
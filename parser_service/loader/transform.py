@@ -0,0 +1,130 @@
+import datetime
+import json
+from typing import Callable
+
+from pydantic import ValidationError
+
+from constants import CARD_VALIDATION, MULTICOLOR_ID, WAREHOUSE_STOCKS
+from exceptions import CardValidationError
+from records import CardRecord
+from schemas import ArticleSchema
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+loads: Callable[[bytes], dict] = orjson.loads if orjson else json.loads
+
+CARD_FIELDS = (
+    ('id', int),
+    ('root', int),
+    ('brandId', int),
+    ('brand', str),
+    ('name', str),
+    ('rating', int),
+    ('feedbacks', int),
+    ('colors', list),
+    ('sizes', list),
+)
+NULLABLE_FIELDS = ('sale', 'priceU', 'salePriceU')
+
+
+def _check(item: dict, field: str, kind: type, nullable: bool = False) -> None:
+    value = item.get(field)
+    if value is None:
+        if nullable:
+            return
+    elif type(value) is kind:
+        return
+    raise CardValidationError(item.get('id'), field)
+
+
+def _validate_schema(item: dict) -> None:
+    try:
+        ArticleSchema(**item)
+    except ValidationError as err:
+        raise CardValidationError(item.get('id'), err.errors()[0]['loc'][0])
+
+
+def validate_card(item: dict) -> None:
+    """Checks the card fields that are written to the db.
+
+    With CARD_VALIDATION = 'pydantic' the top level fields go through
+    ArticleSchema as before the lean checks, several times slower.
+    """
+    if CARD_VALIDATION == 'pydantic':
+        _validate_schema(item)
+    else:
+        for field, kind in CARD_FIELDS:
+            _check(item, field, kind)
+        for field in NULLABLE_FIELDS:
+            _check(item, field, int, nullable=True)
+    for color in item['colors']:
+        _check(color, 'id', int)
+    for size in item['sizes']:
+        _check(size, 'stocks', list)
+
+
+def card_record(item: dict, chunk: int, category_id: int,
+                timestamp: datetime.datetime) -> CardRecord:
+    """Record of one card from the cards response"""
+    validate_card(item)
+
+    size_names = []
+    size_counts = []
+    stocks = []
+    for position, size in enumerate(item['sizes']):
+        size_count = 0
+        for stock in size['stocks']:
+            qty = stock.get('qty') or 0
+            size_count += qty
+            if WAREHOUSE_STOCKS and type(stock.get('wh')) is int:
+                stocks.append((position, stock['wh'], qty))
+        size_names.append(size.get('name'))
+        size_counts.append(size_count)
+
+    colors = item['colors']
+    color = None
+    if colors:
+        color = MULTICOLOR_ID if len(colors) > 1 else colors[0]['id']
+
+    return CardRecord(
+        chunk=chunk,
+        category=category_id,
+        article=item['id'],
+        item=item['root'],
+        brand=item['brandId'],
+        brand_name=item['brand'],
+        name=item['name'],
+        color=color,
+        color_ids=tuple(color['id'] for color in colors),
+        color_names=tuple(color.get('name') for color in colors),
+        size_names=tuple(size_names),
+        size_counts=tuple(size_counts),
+        timestamp=timestamp,
+        price_full=item.get('priceU'),
+        price_with_discount=item.get('salePriceU'),
+        sale=item.get('sale'),
+        rating=item['rating'],
+        feedbacks=item['feedbacks'],
+        sum_count=sum(size_counts),
+        stocks=tuple(stocks),
+    )
+
+
+def decode_cards(
+        body: bytes, chunk: int, category_id: int,
+        timestamp: datetime.datetime) -> tuple[list[CardRecord], list[str]]:
+    """Records of the valid cards of a cards response body and the errors.
+
+    Runs in the transform pool, so errors come back as text to be logged
+    by the loop.
+    """
+    records, errors = [], []
+    for item in loads(body).get('data').get('products'):
+        try:
+            records.append(card_record(item, chunk, category_id, timestamp))
+        except CardValidationError as err:
+            errors.append(str(err))
+    return records, errors
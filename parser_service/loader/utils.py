@@ -0,0 +1,12 @@
+from typing import Iterator
+
+from constants import MAX_QUERY_PARAMS
+
+
+def chunk_rows(rows: list[dict]) -> Iterator[list[dict]]:
+    """Splits rows so that one statement stays under the bind params limit"""
+    if not rows:
+        return
+    step = max(1, MAX_QUERY_PARAMS // len(rows[0]))
+    for idx in range(0, len(rows), step):
+        yield rows[idx:idx + step]
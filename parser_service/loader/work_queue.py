@@ -0,0 +1,263 @@
+import asyncio
+import datetime
+import os
+import socket
+from contextvars import ContextVar
+from typing import Any, Callable, Iterable, Optional
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import CrawlTask
+from db.session import async_session
+from logger_config import parser_logger as logger
+
+from constants import (TASK_CLAIM_BATCH, TASK_HEARTBEAT_INTERVAL, TASK_LEASE,
+                       TASK_MAX_ATTEMPTS, TASK_POLL_INTERVAL)
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+# pg_advisory_xact_lock key held while a run is picked or seeded
+RUN_LOCK_KEY = 7_270_014
+
+
+class LocalQueue(asyncio.Queue):
+    """In-memory pipeline stage, retry puts the item back"""
+
+    async def retry(self, item: Any) -> None:
+        await self.put(item)
+
+
+class PgQueue:
+    """One pipeline stage of a distributed run kept in crawl_tasks.
+
+    Works as a drop-in for the asyncio.Queue of the stage. Units are
+    claimed TASK_CLAIM_BATCH at a time with FOR UPDATE SKIP LOCKED and
+    leased for TASK_LEASE seconds, the heartbeat extends the leases of
+    units still being worked on and marks finished ones done. Units of a
+    dead worker are claimed again once their lease runs out, a unit whose
+    lease ran out TASK_MAX_ATTEMPTS times is marked failed and left for
+    the next host joining the run. task_done() knows which unit it
+    finishes from the context of the worker task that got it, or from
+    hold() if the unit outlives its worker.
+    """
+
+    def __init__(self, run: datetime.datetime, stage: str,
+                 key: Callable[[Any], str],
+                 owner: Optional[str] = None) -> None:
+        self.run = run
+        self.stage = stage
+        self._key = key
+        self._owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+        self._buffer: asyncio.Queue = asyncio.Queue()
+        self._claim_lock = asyncio.Lock()
+        self._current: ContextVar[Optional[int]] = ContextVar(
+            f'{stage}_task', default=None)
+        self._claimed: set[int] = set()
+        self._done: list[int] = []
+        self._remaining: Optional[int] = None
+        self.claims = 0
+
+    async def put(self, item: Any) -> None:
+        async with async_session() as session:
+            async with session.begin():
+                await publish(session, self.run, self.stage,
+                              [(self._key(item), item)])
+
+    async def retry(self, item: Any) -> None:
+        """Makes a finished unit pending again"""
+        async with async_session() as session:
+            async with session.begin():
+                await session.execute(
+                    insert(CrawlTask)
+                    .values(run=self.run, stage=self.stage,
+                            key=self._key(item), payload=item,
+                            status=PENDING)
+                    .on_conflict_do_update(
+                        index_elements=[CrawlTask.run, CrawlTask.stage,
+                                        CrawlTask.key],
+                        set_={'status': PENDING, 'owner': None,
+                              'lease_until': None}))
+
+    async def get(self) -> Any:
+        while self._buffer.empty():
+            async with self._claim_lock:
+                if self._buffer.empty() and not await self._claim():
+                    await asyncio.sleep(TASK_POLL_INTERVAL)
+        task_id, item = self._buffer.get_nowait()
+        self._current.set(task_id)
+        return item
+
+    def task_done(self) -> None:
+        task_id = self._current.get()
+        if task_id is not None:
+            self._claimed.discard(task_id)
+            self._done.append(task_id)
+            self._current.set(None)
+
+    def hold(self) -> Optional[int]:
+        """Keeps the current unit claimed past task_done, till release()"""
+        task_id = self._current.get()
+        self._current.set(None)
+        return task_id
+
+    def release(self, task_id: int) -> None:
+        self._claimed.discard(task_id)
+        self._done.append(task_id)
+
+    def abandon(self, task_id: int) -> None:
+        """Lets the lease of a held unit run out for it to be claimed again"""
+        self._claimed.discard(task_id)
+
+    def qsize(self) -> int:
+        """Claimed units not yet taken by a worker"""
+        return self._buffer.qsize()
+
+    def empty(self) -> bool:
+        return self._buffer.empty() and self._remaining == 0
+
+    async def join(self) -> None:
+        """Waits until no worker of the run has units of the stage left"""
+        while True:
+            await self.flush()
+            async with async_session() as session:
+                self._remaining = await session.scalar(
+                    select(func.count()).select_from(CrawlTask).where(
+                        CrawlTask.run == self.run,
+                        CrawlTask.stage == self.stage,
+                        CrawlTask.status.in_((PENDING, CLAIMED))))
+            if not self._remaining:
+                return
+            await asyncio.sleep(TASK_POLL_INTERVAL)
+
+    async def _claim(self) -> int:
+        expired = and_(CrawlTask.run == self.run,
+                       CrawlTask.stage == self.stage,
+                       CrawlTask.status == CLAIMED,
+                       CrawlTask.lease_until < func.now())
+        claimable = (
+            select(CrawlTask.id)
+            .where(CrawlTask.run == self.run,
+                   CrawlTask.stage == self.stage,
+                   or_(CrawlTask.status == PENDING,
+                       and_(CrawlTask.status == CLAIMED,
+                            CrawlTask.lease_until < func.now())))
+            .order_by(CrawlTask.id)
+            .limit(TASK_CLAIM_BATCH)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with async_session() as session:
+            async with session.begin():
+                failed = await session.execute(
+                    update(CrawlTask)
+                    .where(expired, CrawlTask.attempts >= TASK_MAX_ATTEMPTS)
+                    .values(status=FAILED, owner=None, lease_until=None)
+                    .execution_options(synchronize_session=False))
+                result = await session.execute(
+                    update(CrawlTask)
+                    .where(CrawlTask.id.in_(claimable))
+                    .values(status=CLAIMED, owner=self._owner,
+                            lease_until=self._lease_until(),
+                            attempts=CrawlTask.attempts + 1)
+                    .returning(CrawlTask.id, CrawlTask.payload)
+                    .execution_options(synchronize_session=False))
+                rows = result.all()
+
+        if failed.rowcount:
+            logger.error('%d %s units failed after %d attempts',
+                         failed.rowcount, self.stage, TASK_MAX_ATTEMPTS)
+        for task_id, payload in rows:
+            self._claimed.add(task_id)
+            self._buffer.put_nowait((task_id, payload))
+        self.claims += len(rows)
+        return len(rows)
+
+    @staticmethod
+    def _lease_until():
+        return func.now() + datetime.timedelta(seconds=TASK_LEASE)
+
+    async def flush(self) -> None:
+        """Marks finished units done and extends the leases of the rest"""
+        done, self._done = self._done, []
+        claimed = list(self._claimed)
+        if not done and not claimed:
+            return
+        async with async_session() as session:
+            async with session.begin():
+                if done:
+                    await session.execute(
+                        update(CrawlTask)
+                        .where(CrawlTask.id.in_(done))
+                        .values(status=DONE, lease_until=None)
+                        .execution_options(synchronize_session=False))
+                if claimed:
+                    await session.execute(
+                        update(CrawlTask)
+                        .where(CrawlTask.id.in_(claimed),
+                               CrawlTask.owner == self._owner,
+                               CrawlTask.status == CLAIMED)
+                        .values(lease_until=self._lease_until())
+                        .execution_options(synchronize_session=False))
+
+    async def heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(TASK_HEARTBEAT_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as err:
+                logger.error('%s heartbeat failed: %s', self.stage, err)
+
+
+async def publish(session: AsyncSession, run: datetime.datetime, stage: str,
+                  units: Iterable[tuple[str, Any]]) -> None:
+    """Adds units of a stage, the ones already known are left as they are"""
+    rows = [{'run': run, 'stage': stage, 'key': key, 'payload': payload,
+             'status': PENDING} for key, payload in units]
+    if rows:
+        await session.execute(
+            insert(CrawlTask).values(rows).on_conflict_do_nothing())
+
+
+async def lock_runs(session: AsyncSession) -> None:
+    """Serialises picking and seeding runs till the transaction ends"""
+    await session.execute(select(func.pg_advisory_xact_lock(RUN_LOCK_KEY)))
+
+
+async def unfinished_run(
+        session: AsyncSession) -> Optional[datetime.datetime]:
+    return await session.scalar(
+        select(func.min(CrawlTask.run)).where(CrawlTask.status != DONE))
+
+
+async def retry_failed(session: AsyncSession, run: datetime.datetime) -> int:
+    """Makes the failed units of a run pending again with fresh attempts"""
+    result = await session.execute(
+        update(CrawlTask)
+        .where(CrawlTask.run == run, CrawlTask.status == FAILED)
+        .values(status=PENDING, attempts=0)
+        .execution_options(synchronize_session=False))
+    return result.rowcount
+
+
+async def failed_units(run: datetime.datetime) -> int:
+    async with async_session() as session:
+        return await session.scalar(
+            select(func.count()).select_from(CrawlTask).where(
+                CrawlTask.run == run, CrawlTask.status == FAILED))
+
+
+async def clear_run(run: datetime.datetime) -> None:
+    """Removes the units of a run once all of them are done"""
+    unfinished = select(CrawlTask.id).where(
+        CrawlTask.run == run, CrawlTask.status != DONE).exists()
+    async with async_session() as session:
+        async with session.begin():
+            await session.execute(
+                delete(CrawlTask)
+                .where(CrawlTask.run == run, ~unfinished)
+                .execution_options(synchronize_session=False))
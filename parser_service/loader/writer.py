@@ -0,0 +1,154 @@
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import (Article, ArticlesHistory, Base, HistorySizeRelation,
+                       Item)
+from db.session import async_session
+from metrics import BATCH_SECONDS, CARDS, ROWS
+
+from constants import MULTICOLOR_ID, SIZE_STORAGE
+from dimensions import DimensionCache
+from history import HistoryState, fingerprint
+from records import CardRecord
+from utils import chunk_rows
+
+
+class BulkWriter:
+    """Writes batches of collected cards, one transaction per batch.
+
+    Sizes go either to history_size_relation, a row per size, or with
+    size_storage 'array' into size_ids and size_counts of the history row.
+    """
+
+    def __init__(self, dimensions: DimensionCache,
+                 history: Optional[HistoryState] = None,
+                 size_storage: str = SIZE_STORAGE) -> None:
+        self._dimensions = dimensions
+        self._history = history
+        self._size_arrays = size_storage == 'array'
+        self.cards = 0
+        self.rows = 0
+        self.batches = 0
+        self.write_time = 0.0
+
+    async def write(self, cards: list[CardRecord]) -> None:
+        started = time.monotonic()
+        rows = self.rows
+
+        brands: dict[int, dict] = {}
+        colors: dict[int, dict] = {}
+        items: dict[int, dict] = {}
+        articles: dict[int, dict] = {}
+        records: dict[int, CardRecord] = {}
+
+        for card in cards:
+            brands[card.brand] = {'id': card.brand, 'name': card.brand_name}
+            for color_id, color_name in zip(card.color_ids, card.color_names):
+                colors[color_id] = {'id': color_id, 'name': color_name}
+            items[card.item] = {'id': card.item, 'category': card.category,
+                                'brand': card.brand}
+
+            if card.color == MULTICOLOR_ID:
+                colors[MULTICOLOR_ID] = {'id': MULTICOLOR_ID,
+                                         'name': 'multicolor'}
+            articles[card.article] = {'id': card.article, 'item': card.item,
+                                      'name': card.name, 'color': card.color}
+            records[card.article] = card
+
+        self.rows += await self._dimensions.ensure_brands(brands.values())
+        self.rows += await self._dimensions.ensure_colors(colors.values())
+        size_ids = await self._dimensions.resolve_sizes(
+            name for card in records.values() for name in card.size_names)
+
+        size_counts = {
+            article_id: {size_ids[name]: count for name, count
+                         in zip(card.size_names, card.size_counts)}
+            for article_id, card in records.items()
+        }
+        stocks = {
+            article_id: [[size_ids[card.size_names[position]], wh, qty]
+                         for position, wh, qty in card.stocks]
+            for article_id, card in records.items()
+        }
+        histories = {article_id: card.history_row()
+                     for article_id, card in records.items()}
+        fingerprints = {}
+        skipped = 0
+        if self._history is not None:
+            for article_id, history in list(histories.items()):
+                value = fingerprint(history, size_counts[article_id],
+                                    stocks[article_id])
+                if self._history.changed(article_id, value):
+                    fingerprints[article_id] = value
+                else:
+                    del histories[article_id]
+                    skipped += 1
+        for article_id, history in histories.items():
+            history['warehouse_stocks'] = stocks[article_id] or None
+            if self._size_arrays:
+                history['size_ids'] = list(size_counts[article_id])
+                history['size_counts'] = list(
+                    size_counts[article_id].values())
+
+        async with async_session() as session:
+            async with session.begin():
+                written = await self._insert(session, Item, items.values())
+                written += await self._insert(session, Article,
+                                              articles.values())
+
+                history_ids = await self._insert_history(
+                    session, list(histories.values()))
+                written += len(history_ids)
+
+                if not self._size_arrays:
+                    relations = [
+                        {'history': history_id, 'size': size_id,
+                         'count': count}
+                        for article_id, history_id in history_ids.items()
+                        for size_id, count in size_counts[article_id].items()
+                    ]
+                    written += await self._insert(
+                        session, HistorySizeRelation, relations)
+
+        if self._history is not None:
+            # a failed batch is written again, skips count once it is done
+            self._history.update(fingerprints, skipped)
+
+        # rows the conflict clauses skipped are not counted, and neither
+        # are the ones of a rolled back attempt
+        self.cards += len(cards)
+        self.rows += written
+        self.batches += 1
+        elapsed = time.monotonic() - started
+        self.write_time += elapsed
+        CARDS.inc(len(cards))
+        ROWS.inc(self.rows - rows)
+        BATCH_SECONDS.observe(elapsed)
+
+    async def _insert(self, session: AsyncSession, entity: type[Base],
+                      rows: Iterable[dict]) -> int:
+        """Rows actually inserted, the conflicting ones are skipped"""
+        primary_key = [column.name
+                       for column in entity.__table__.primary_key]
+        rows = sorted(rows, key=lambda row: [row[key] for key in primary_key])
+        inserted = 0
+        for chunk in chunk_rows(rows):
+            result = await session.execute(
+                insert(entity).values(chunk).on_conflict_do_nothing())
+            inserted += result.rowcount
+        return inserted
+
+    async def _insert_history(self, session: AsyncSession,
+                              rows: list[dict]) -> dict[int, int]:
+        history_ids = {}
+        for chunk in chunk_rows(rows):
+            result = await session.execute(
+                insert(ArticlesHistory).values(chunk)
+                .on_conflict_do_nothing(index_elements=[
+                    ArticlesHistory.article, ArticlesHistory.timestamp])
+                .returning(ArticlesHistory.article, ArticlesHistory.id))
+            history_ids.update(result.all())
+        return history_ids
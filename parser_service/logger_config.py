@@ -1,8 +1,16 @@
+import atexit
 import logging
+import os
+import queue
+import time
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
 
 
-DEFAULT_LEVEL = "DEBUG"
+DEFAULT_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# per-request messages: at most LOG_BURST of each per LOG_INTERVAL seconds
+LOG_BURST = 10
+LOG_INTERVAL = 10
 
 logging_schema = {
     "version": 1,
@@ -42,5 +50,67 @@ logging_schema = {
     }
 }
 
+
+class RateLimitFilter(logging.Filter):
+    """Passes at most burst records of one message per interval seconds.
+
+    Messages are told apart by their format string, the first record of
+    the next interval says how many were dropped.
+    """
+
+    def __init__(self, burst: int = LOG_BURST,
+                 interval: float = LOG_INTERVAL) -> None:
+        super().__init__()
+        self._burst = burst
+        self._interval = interval
+        # format string -> [interval start, passed, dropped]
+        self._windows: dict[str, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        now = time.monotonic()
+        window = self._windows.get(record.msg)
+        if window is None or now - window[0] >= self._interval:
+            dropped = window[2] if window else 0
+            window = self._windows[record.msg] = [now, 0, 0]
+            if dropped:
+                record.msg = f'{record.msg} ({dropped} similar dropped)'
+        if window[1] < self._burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+def _start_listener() -> QueueListener:
+    """Moves formatting and writing of records to a listener thread"""
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    handlers = []
+    for logger in (logging.getLogger(), logging.getLogger("__main__")):
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            if handler not in handlers:
+                handlers.append(handler)
+        logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, *handlers,
+                             respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def set_level(level: str) -> None:
+    """Log level of the run, for --log-level"""
+    level = level.upper()
+    for name in ("", "__main__"):
+        logging.getLogger(name).setLevel(level)
+    for handler in listener.handlers:
+        handler.setLevel(level)
+
+
 dictConfig(logging_schema)
+listener = _start_listener()
 parser_logger = logging.getLogger(__name__)
+request_logger = logging.getLogger(f"{__name__}.requests")
+request_logger.addFilter(RateLimitFilter())
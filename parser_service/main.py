@@ -1,9 +1,11 @@
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.routing import APIRouter
 
+from api.cache import category_tree
 from api.handlers import parser_router
 from logger_config import parser_logger as logger
+from metrics import latest_metrics
 from settings import API_PREFIX, API_TITLE, HOST, PORT, ROUTER_TAGS
 
 
@@ -25,6 +27,22 @@ main_api_router.include_router(
 app.include_router(main_api_router)
 
 
+@app.on_event("startup")
+async def start_category_cache() -> None:
+    await category_tree.start()
+
+
+@app.on_event("shutdown")
+async def stop_category_cache() -> None:
+    await category_tree.stop()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    body, content_type = latest_metrics()
+    return Response(body, media_type=content_type)
+
+
 def main():
     try:
         uvicorn.run(app, host=HOST, port=PORT)
@@ -0,0 +1,50 @@
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, start_http_server)
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# with PROMETHEUS_MULTIPROC_DIR set, every process writes its samples to
+# that dir and /metrics of the api sums up the loaders of the host
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+QUEUE_DEPTH = Gauge(
+    "loader_queue_depth", "Units waiting in a pipeline stage",
+    ["stage"], multiprocess_mode="livesum")
+REQUEST_SECONDS = Histogram(
+    "loader_request_seconds", "Wildberries request latency",
+    ["endpoint", "outcome"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+RETRIES = Counter(
+    "loader_retries", "Requests repeated after a failure", ["endpoint"])
+CARDS = Counter("loader_cards", "Cards written to the db")
+ROWS = Counter("loader_rows", "Rows written to the db")
+BATCH_SECONDS = Histogram(
+    "loader_batch_seconds", "Time to write one batch of cards",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+
+def endpoint(url: str) -> str:
+    """Kind of Wildberries request, for labels"""
+    if "/filters?" in url:
+        return "filters"
+    if "/catalog?" in url:
+        return "catalog"
+    if "nm=" in url:
+        return "cards"
+    return "other"
+
+
+def latest_metrics() -> tuple[bytes, str]:
+    """Body and content type of a /metrics response"""
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def serve_metrics(port: int) -> None:
+    """Exposes the metrics of this process on a port of its own"""
+    start_http_server(port)
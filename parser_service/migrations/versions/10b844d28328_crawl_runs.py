@@ -0,0 +1,35 @@
+"""crawl runs
+
+Revision ID: 10b844d28328
+Revises: 6e6c99d892ab
+Create Date: 2026-10-17 11:02:37.560931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '10b844d28328'
+down_revision = '6e6c99d892ab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('crawl_runs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('keyframe', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('timestamp')
+    )
+    # every run before change-only writes stored full snapshots
+    op.execute("""
+        INSERT INTO crawl_runs (timestamp, keyframe)
+        SELECT DISTINCT timestamp, true FROM articles_history
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('crawl_runs')
@@ -0,0 +1,44 @@
+"""unique article snapshot per run
+
+Revision ID: 172df325bd74
+Revises: 10b844d28328
+Create Date: 2026-10-17 12:31:50.207114
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '172df325bd74'
+down_revision = '10b844d28328'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # articles met in several categories were written once per category
+    op.execute("""
+        CREATE TEMPORARY TABLE history_duplicates ON COMMIT DROP AS
+        SELECT id FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY article, timestamp ORDER BY id) AS number
+            FROM articles_history
+        ) AS ranked
+        WHERE number > 1
+    """)
+    op.execute("""
+        DELETE FROM history_size_relation
+        WHERE history IN (SELECT id FROM history_duplicates)
+    """)
+    op.execute("""
+        DELETE FROM articles_history
+        WHERE id IN (SELECT id FROM history_duplicates)
+    """)
+    op.create_unique_constraint(
+        'articles_history_article_timestamp_key',
+        'articles_history', ['article', 'timestamp'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('articles_history_article_timestamp_key',
+                       'articles_history', type_='unique')
@@ -0,0 +1,61 @@
+"""price rollups
+
+Revision ID: 425bd87939ad
+Revises: 8d4e2b1f6a90
+Create Date: 2026-10-17 18:44:54.976289
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '425bd87939ad'
+down_revision = '8d4e2b1f6a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('article_daily_prices',
+    sa.Column('article', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('min_price', sa.Integer(), nullable=True),
+    sa.Column('max_price', sa.Integer(), nullable=True),
+    sa.Column('price_sum', sa.BigInteger(), nullable=True),
+    sa.Column('prices', sa.Integer(), nullable=True),
+    sa.Column('last_price', sa.Integer(), nullable=True),
+    sa.Column('stock', sa.Integer(), nullable=True),
+    sa.Column('last_timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['article'], ['articles.id'], ),
+    sa.PrimaryKeyConstraint('article', 'day')
+    )
+    op.create_index('article_daily_prices_day_idx', 'article_daily_prices',
+                    ['day'], unique=False)
+    op.create_table('category_daily_prices',
+    sa.Column('category', sa.Integer(), nullable=False),
+    sa.Column('brand', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('min_price', sa.Integer(), nullable=True),
+    sa.Column('max_price', sa.Integer(), nullable=True),
+    sa.Column('price_sum', sa.BigInteger(), nullable=True),
+    sa.Column('prices', sa.Integer(), nullable=True),
+    sa.Column('articles', sa.Integer(), nullable=True),
+    sa.Column('stock', sa.BigInteger(), nullable=True),
+    sa.PrimaryKeyConstraint('category', 'brand', 'day')
+    )
+    # the rollups fold the snapshots of one run at a time
+    op.create_index('articles_history_timestamp_idx', 'articles_history',
+                    ['timestamp'], unique=False)
+    op.add_column('crawl_runs',
+                  sa.Column('rolled_up', sa.Boolean(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('crawl_runs', 'rolled_up')
+    op.drop_index('articles_history_timestamp_idx',
+                  table_name='articles_history')
+    op.drop_table('category_daily_prices')
+    op.drop_index('article_daily_prices_day_idx',
+                  table_name='article_daily_prices')
+    op.drop_table('article_daily_prices')
@@ -0,0 +1,40 @@
+"""crawl tasks
+
+Revision ID: 5c3a91e07d42
+Revises: 172df325bd74
+Create Date: 2026-10-17 18:40:12.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5c3a91e07d42'
+down_revision = '172df325bd74'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('crawl_tasks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('run', sa.DateTime(), nullable=True),
+    sa.Column('stage', sa.String(), nullable=True),
+    sa.Column('key', sa.String(), nullable=True),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('owner', sa.String(), nullable=True),
+    sa.Column('lease_until', sa.DateTime(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('run', 'stage', 'key')
+    )
+    op.create_index('crawl_tasks_claim_idx', 'crawl_tasks',
+                    ['run', 'stage', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('crawl_tasks_claim_idx', table_name='crawl_tasks')
+    op.drop_table('crawl_tasks')
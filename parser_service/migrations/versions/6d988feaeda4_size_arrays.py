@@ -0,0 +1,34 @@
+"""size arrays
+
+Revision ID: 6d988feaeda4
+Revises: 425bd87939ad
+Create Date: 2026-10-17 18:49:18.532895
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '6d988feaeda4'
+down_revision = '425bd87939ad'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # nullable, the rows written to history_size_relation keep NULL here
+    op.add_column('articles_history', sa.Column(
+        'size_ids', postgresql.ARRAY(sa.Integer()), nullable=True))
+    op.add_column('articles_history', sa.Column(
+        'size_counts', postgresql.ARRAY(sa.Integer()), nullable=True))
+    op.add_column('articles_history', sa.Column(
+        'warehouse_stocks', postgresql.ARRAY(sa.Integer(), dimensions=2),
+        nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('articles_history', 'warehouse_stocks')
+    op.drop_column('articles_history', 'size_counts')
+    op.drop_column('articles_history', 'size_ids')
@@ -0,0 +1,46 @@
+"""unique size name
+
+Revision ID: 6e6c99d892ab
+Revises: af456b7fcfdf
+Create Date: 2026-10-17 10:12:04.118342
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '6e6c99d892ab'
+down_revision = 'af456b7fcfdf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # point relations of duplicated sizes to the oldest size with that name
+    op.execute("""
+        CREATE TEMPORARY TABLE size_duplicates ON COMMIT DROP AS
+        SELECT id, keep FROM (
+            SELECT id, min(id) OVER (PARTITION BY name) AS keep FROM sizes
+        ) AS ranked
+        WHERE id <> keep
+    """)
+    op.execute("""
+        DELETE FROM history_size_relation AS relation
+        USING size_duplicates AS dup
+        WHERE relation.size = dup.id
+          AND EXISTS (
+            SELECT 1 FROM history_size_relation AS kept
+            WHERE kept.history = relation.history AND kept.size = dup.keep
+          )
+    """)
+    op.execute("""
+        UPDATE history_size_relation AS relation SET size = dup.keep
+        FROM size_duplicates AS dup
+        WHERE relation.size = dup.id
+    """)
+    op.execute("DELETE FROM sizes WHERE id IN (SELECT id FROM size_duplicates)")
+    op.create_unique_constraint('sizes_name_key', 'sizes', ['name'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('sizes_name_key', 'sizes', type_='unique')
@@ -0,0 +1,32 @@
+"""read api indexes
+
+Revision ID: 8d4e2b1f6a90
+Revises: 5c3a91e07d42
+Create Date: 2026-10-17 19:02:37.640211
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4e2b1f6a90'
+down_revision = '5c3a91e07d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # articles of a category or brand are found through their items,
+    # history pages go by the (article, timestamp) unique constraint
+    op.create_index('items_category_idx', 'items',
+                    ['category', 'id'], unique=False)
+    op.create_index('items_brand_idx', 'items',
+                    ['brand', 'id'], unique=False)
+    op.create_index('articles_item_idx', 'articles',
+                    ['item', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('articles_item_idx', table_name='articles')
+    op.drop_index('items_brand_idx', table_name='items')
+    op.drop_index('items_category_idx', table_name='items')
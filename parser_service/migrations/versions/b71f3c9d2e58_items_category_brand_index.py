@@ -0,0 +1,26 @@
+"""items category brand index
+
+Revision ID: b71f3c9d2e58
+Revises: 6d988feaeda4
+Create Date: 2026-10-17 19:20:11.304518
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71f3c9d2e58'
+down_revision = '6d988feaeda4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # articles pages of a category and a brand go through the items
+    # of both in id order, as they do with one of them
+    op.create_index('items_category_brand_idx', 'items',
+                    ['category', 'brand', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('items_category_brand_idx', table_name='items')